@@ -0,0 +1,167 @@
+import os.path
+import ssl
+import asyncio
+import concurrent.futures
+import logging
+from datetime import timedelta
+
+from BridgePython import tcp, data
+
+'''
+asyncio backend. Selected with Bridge(loop='asyncio') or
+Bridge(loop=some_event_loop); bridge.connect() then returns a future
+that resolves once the handshake completes.
+'''
+
+
+class AsyncioLoop(object):
+    '''Offers the parts of the tornado IOLoop interface Bridge uses.'''
+
+    def __init__(self, loop=None):
+        self.asyncio_loop = loop
+
+    def _loop(self):
+        if self.asyncio_loop is None:
+            self.asyncio_loop = asyncio.get_event_loop()
+        return self.asyncio_loop
+
+    def add_timeout(self, deadline, callback, *args):
+        loop = self._loop()
+        if isinstance(deadline, timedelta):
+            return loop.call_later(deadline.total_seconds(), callback, *args)
+        return loop.call_at(deadline, callback, *args)
+
+    def remove_timeout(self, handle):
+        handle.cancel()
+
+    def add_callback(self, callback, *args):
+        self._loop().call_soon_threadsafe(callback, *args)
+
+    def add_future(self, future, callback):
+        if isinstance(future, concurrent.futures.Future):
+            future = asyncio.wrap_future(future, loop=self._loop())
+        else:
+            future = asyncio.ensure_future(future, loop=self._loop())
+        future.add_done_callback(callback)
+
+    def create_future(self):
+        return self._loop().create_future()
+
+    def spawn(self, awaitable):
+        return asyncio.ensure_future(awaitable, loop=self._loop())
+
+    def time(self):
+        return self._loop().time()
+
+    def start(self):
+        # The application runs the asyncio loop itself
+        pass
+
+
+class AsyncioTcp(tcp.Tcp):
+    '''Tcp transport built on an asyncio.Protocol.'''
+
+    def connect(self):
+        connection = self.connection
+        self.stream = None
+        context = None
+        if connection.options['secure']:
+            cert_dir = os.path.split(data.__file__)[0]
+            context = ssl.create_default_context(cafile=os.path.join(cert_dir, 'flotype.crt'))
+        loop = connection.loop._loop()
+        task = loop.create_connection(lambda: _Protocol(self),
+                connection.options['host'], connection.options['port'], ssl=context)
+        connection.loop.add_future(task, self.onconnect)
+
+    def onconnect(self, future):
+        if future.cancelled() or future.exception() is not None:
+            logging.error('Unable to connect: %s', future.exception())
+            self.connection.onclose()
+
+    def wait(self):
+        # The protocol is fed as data arrives
+        pass
+
+    def write(self, data):
+        # The transport reports its buffer through pause_writing
+        self.stream.write(data)
+
+    def write_buffer_size(self):
+        return self.stream.transport.get_write_buffer_size() if self.stream else 0
+
+    def pause(self):
+        self.paused = True
+        self.stream.transport.pause_reading()
+
+    def resume(self):
+        self.paused = False
+        if not self.stream.closed():
+            self.stream.transport.resume_reading()
+
+    def close(self):
+        if self.outbound:
+            # Close once frames being compressed are written
+            self.close_pending = True
+            return
+        self.flush()
+        # Transports write out their buffer before closing
+        self.stream.transport.close()
+
+
+class _Stream(object):
+    # Gives a transport the write and closed methods Tcp uses
+    def __init__(self, transport):
+        self.transport = transport
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def closed(self):
+        return self.transport.is_closing()
+
+
+class _Protocol(asyncio.Protocol):
+    def __init__(self, tcp):
+        self.tcp = tcp
+
+    def connection_made(self, transport):
+        options = self.tcp.connection.options
+        if options['write_high'] is not None:
+            transport.set_write_buffer_limits(options['write_high'], options['write_low'])
+        self.tcp.stream = _Stream(transport)
+        self.tcp.connection.onopen(self.tcp)
+
+    def pause_writing(self):
+        # Also called past the transport's default limits
+        if self.tcp.connection.options['write_high'] is not None:
+            self.tcp.connection.onsaturated()
+
+    def resume_writing(self):
+        self.tcp.connection.ondrained()
+
+    def data_received(self, data):
+        self.tcp.receive_data(data)
+
+    def connection_lost(self, exc):
+        self.tcp.connection.onclose()
+
+
+def ready(bridge):
+    '''Returns a future resolved with bridge once it is ready.'''
+    future = bridge._connection.loop._loop().create_future()
+
+    def onready():
+        if not future.done():
+            future.set_result(bridge)
+    bridge.ready(onready)
+    return future
+
+
+def call(method, *args, **kwargs):
+    '''Calls a remote method, passing a callback as the last argument.
+
+    Returns a future resolved with the argument the remote side calls the
+    callback with, or a tuple when it passes several. Same as
+    bridge.request.
+    '''
+    return method._reference._bridge.request(method, *args, **kwargs)
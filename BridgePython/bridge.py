@@ -1,8 +1,12 @@
+import time
+import inspect
+import contextvars
+import weakref
 import logging
 import traceback
 from collections import defaultdict
 
-from BridgePython import util, connection, reference, serializer, client
+from BridgePython import util, connection, reference, serializer, client, store, executor, rpc, metrics, trace
 
 '''
 @package bridge
@@ -21,11 +25,90 @@ class Bridge(object):
         @keyword log: Specifies a log level. Defaults to logging.WARNING.
         @keyword redirector: Bridge redirector. Defaults to
         http://redirector.getbridge.com.
+        @keyword redirector_timeout: Seconds to wait for the redirector.
+        Defaults to 10.
+        @keyword redirector_ttl: Seconds the host and port returned by the
+        redirector are reused for, unless connecting to them fails before the
+        handshake. Defaults to 3600.
+        @keyword redirector_cache: File to keep redirector answers in across
+        restarts. No default.
         @keyword host: Bridge host. No default. Set a value to disable
         redirector based connect.
         @keyword port: Bridge port. No default. Set a value to disable
         redirector based connect.
         @keyword reconnect: Defaults to True to enable reconnects.
+        @keyword reconnect_base: Milliseconds before the first reconnect
+        attempt. Defaults to 400.
+        @keyword reconnect_cap: Longest delay between reconnect attempts, in
+        milliseconds. Defaults to 32768.
+        @keyword reconnect_jitter: Fraction of each delay that is randomized.
+        Defaults to 0.5.
+        @keyword reconnect_attempts: Reconnect attempts before giving up. No
+        default, attempts never stop.
+        @keyword reconnect_policy: An object with a delay(attempt) method and a
+        max_attempts attribute, replacing the settings above.
+        @keyword buffer_limit: Messages kept while disconnected. No default.
+        @keyword buffer_flush: Messages sent from the buffer per IOLoop
+        iteration once connected. Defaults to 100.
+        @keyword buffer_policy: What sending to a full buffer does: 'drop'
+        (the default) drops the message and emits 'dropped', 'error' raises
+        connection.BufferFull and 'block' makes threads other than the loop's
+        wait for room (it raises on the loop thread).
+        @keyword store_limit: Maximum number of callbacks and objects kept for
+        the server. Least recently used ones are evicted first. No default.
+        @keyword store_ttl: Seconds an unused callback or object is kept for
+        the server. No default.
+        @keyword batch: Defaults to False. Set to True to coalesce outgoing
+        messages into a single socket write per IOLoop iteration.
+        @keyword batch_bytes: Flush a batch early once it holds this many
+        bytes. Defaults to 65536.
+        @keyword batch_latency: Milliseconds a batch may wait before it is
+        flushed. Defaults to 0, flushing at the end of the IOLoop iteration.
+        @keyword codec: JSON library used on the wire: 'orjson', 'rapidjson',
+        'ujson', 'json' or an object with encode and decode methods. Defaults
+        to the fastest one installed. Only 'rapidjson' and 'json' convert
+        refs while parsing.
+        @keyword encoding: Binary encoding to propose to the server at
+        CONNECT, 'msgpack', or a list of them in order of preference. JSON
+        is used if the server declines. No default.
+        @keyword compression: Frame compression to propose to the server at
+        CONNECT: 'zstd', 'lz4', 'zlib', a list of them in order of
+        preference, or True for every one installed. No default.
+        @keyword compress_threshold: Bytes from which frames are compressed.
+        Defaults to 16384.
+        @keyword compress_offload: Bytes from which frames are compressed
+        and decompressed on a worker thread. Defaults to 1048576.
+        @keyword write_high: Bytes written but not yet sent over the socket
+        above which the connection stops being writable. No default.
+        @keyword write_low: Bytes below which it is writable again, emitting
+        'drain'. Defaults to half of write_high.
+        @keyword write_policy: What sending a message to a service, client
+        or channel does while not writable: 'block' (the default) makes
+        threads other than the loop's wait, 'drop' drops channel messages
+        and emits 'dropped', and 'error' raises connection.WriteBufferFull.
+        Code on the loop should wait on drain() instead.
+        @keyword inbound_budget: Milliseconds spent handling received messages
+        before yielding to the IOLoop, so writes and timers are not starved.
+        Defaults to 10. Set to None to handle everything received at once.
+        @keyword executor_workers: Pool size of 'thread' and 'process'
+        executors. Defaults to 4.
+        @keyword executor_queue: Calls a 'thread' or 'process' executor may
+        hold before reading from the server pauses. Defaults to 100.
+        @keyword loop: Defaults to None to run on the tornado IOLoop. Set to
+        'asyncio' or an asyncio event loop to use the asyncio backend, in
+        which case connect returns a future.
+        @keyword request_timeout: Seconds before a request made with
+        request() fails. No default.
+        @keyword max_inflight: Requests made with request() that may await
+        replies at once. No default.
+        @keyword metrics: Defaults to None, recording nothing. Set to True or
+        a metrics.Metrics instance to record counters and timings, read with
+        get_metrics().
+        @keyword trace: Defaults to None. Set to True to log messages sent and
+        received, and calls made on references, to the 'BridgePython.wire'
+        logger at DEBUG level, whatever the log option. A dict of sample
+        (log one message in this many), limit (bytes of each message logged)
+        and level configures it, as does a trace.WireTrace instance.
         '''
         # Set configuration options
         self._options = {}
@@ -34,20 +117,67 @@ class Bridge(object):
         self._options['redirector'] = kwargs.get('redirector', 'http://redirector.getbridge.com')
         self._options['secure_redirector'] = kwargs.get('secure_redirector',
                 'https://redirector.getbridge.com')
+        self._options['redirector_timeout'] = kwargs.get('redirector_timeout', 10)
+        self._options['redirector_ttl'] = kwargs.get('redirector_ttl', 3600)
+        self._options['redirector_cache'] = kwargs.get('redirector_cache')
         self._options['host'] = kwargs.get('host')
         self._options['port'] = kwargs.get('port')
         self._options['reconnect'] = kwargs.get('reconnect', True)
+        self._options['reconnect_base'] = kwargs.get('reconnect_base', 400)
+        self._options['reconnect_cap'] = kwargs.get('reconnect_cap', 32768)
+        self._options['reconnect_jitter'] = kwargs.get('reconnect_jitter', 0.5)
+        self._options['reconnect_attempts'] = kwargs.get('reconnect_attempts')
+        self._options['reconnect_policy'] = kwargs.get('reconnect_policy')
+        self._options['buffer_limit'] = kwargs.get('buffer_limit')
+        self._options['buffer_policy'] = kwargs.get('buffer_policy', 'drop')
+        self._options['buffer_flush'] = kwargs.get('buffer_flush', 100)
         self._options['secure'] = kwargs.get('secure', False)
+        self._options['store_limit'] = kwargs.get('store_limit')
+        self._options['store_ttl'] = kwargs.get('store_ttl')
+        self._options['batch'] = kwargs.get('batch', False)
+        self._options['batch_bytes'] = kwargs.get('batch_bytes', 65536)
+        self._options['batch_latency'] = kwargs.get('batch_latency', 0)
+        self._options['codec'] = kwargs.get('codec')
+        self._options['encoding'] = kwargs.get('encoding')
+        self._options['compression'] = kwargs.get('compression')
+        self._options['compress_threshold'] = kwargs.get('compress_threshold', 16384)
+        self._options['compress_offload'] = kwargs.get('compress_offload', 1048576)
+        self._options['write_high'] = kwargs.get('write_high')
+        self._options['write_low'] = kwargs.get('write_low')
+        if self._options['write_high'] and self._options['write_low'] is None:
+            self._options['write_low'] = self._options['write_high'] // 2
+        self._options['write_policy'] = kwargs.get('write_policy', 'block')
+        self._options['inbound_budget'] = kwargs.get('inbound_budget', 10)
+        self._options['executor_workers'] = kwargs.get('executor_workers', 4)
+        self._options['executor_queue'] = kwargs.get('executor_queue', 100)
+        self._options['loop'] = kwargs.get('loop')
+        self._options['request_timeout'] = kwargs.get('request_timeout')
+        self._options['max_inflight'] = kwargs.get('max_inflight')
+        self._options['metrics'] = kwargs.get('metrics')
+        self._options['trace'] = kwargs.get('trace')
 
         if(self._options['secure']):
             self._options['redirector'] = self._options['secure_redirector']
 
         util.set_log_level(self._options['log'])
 
+        self._metrics = metrics.get_metrics(self._options['metrics'])
+        self._trace = trace.get_trace(self._options['trace'])
+
         # Initialize system service call
-        self._store = {
-            'system': _SystemService(self)
-        }
+        self._store = store.Store(self._options['store_limit'], self._options['store_ttl'])
+        self._store['system'] = _SystemService(self)
+
+        # Executors of services not run inline, by store name
+        self._executors = {}
+
+        # Argument validators by store name and method
+        self._validators = {}
+
+        # Handlers of named entries by store name and method, rebuilt
+        # whenever the entry is replaced
+        self._dispatch = {}
+        self._compile('system')
 
         # Indicates whether server is connected and handshaken
         self._ready = False
@@ -58,7 +188,18 @@ class Bridge(object):
         # Store event handlers
         self._events = defaultdict(list)
 
-        self._context = None;
+        # Requests awaiting replies
+        self._requests = rpc.Requests(self)
+
+        self._metrics.add_collector(self._collect_metrics)
+
+        # Id of the client whose message is being handled, per call
+        self._source = contextvars.ContextVar('source', default=None)
+        self._clients = {}
+        # References to services and channels handed out, by address
+        self._references = weakref.WeakValueDictionary()
+        # Channels GETCHANNEL was sent for in this session
+        self._fetched_channels = set()
 
     def on(self, name, func):
         '''Registers a callback for the specified event.
@@ -67,6 +208,9 @@ class Bridge(object):
         ready/0
         disconnect/0
         reconnect/0
+        reconnect_failed/0
+        dropped/1 (msg)
+        drain/0
         remote_error/1 (msg)
 
         @param name: The name of the event.
@@ -91,21 +235,29 @@ class Bridge(object):
         '''
         self._events[name] = []
 
-    def publish_service(self, name, handler, callback=None):
+    def publish_service(self, name, handler, callback=None, executor=None, validators=None):
         '''Publish a service to Bridge.
 
         @param name: The name of the service.
         @param handler: Any class with a default constructor, or any instance.
         @param callback: Called (with name of service as argument) when the service has been
         published.
+        @param executor: Where handler methods run: 'inline' (the default),
+        'thread', 'process' or an executor instance.
+        @param validators: A dict of method name to a function called with
+        the arguments of each call to that method. Calls it raises for are
+        dropped.
         '''
         if name == 'system':
             logging.error('Invalid service name: %s', name)
         else:
             self._store[name] = handler
+            self._set_executor(name, executor)
+            self._validators[name] = validators or {}
+            self._compile(name)
             data = {'name': name}
             if callback:
-                data['callback'] = serializer.serialize(self, callback)
+                data['callback'] = serializer.serialize(self, callback, once=True)
             self._connection.send_command('JOINWORKERPOOL', data)
 
     def store_service(self, name, handler):
@@ -118,6 +270,7 @@ class Bridge(object):
             logging.error('Invalid service name: %s', name)
         else:
             self._store[name] = handler
+            self._compile(name)
 
     def unpublish_service(self, name, callback=None):
         '''Stops publishing a service to Bridge.
@@ -130,7 +283,7 @@ class Bridge(object):
         else:
             data = {'name': name}
             if callback:
-                data['callback'] = serializer.serialize(self, callback)
+                data['callback'] = serializer.serialize(self, callback, once=True)
             self._connection.send_command('LEAVEWORKERPOOL', data)
 
     def get_service(self, name):
@@ -139,7 +292,7 @@ class Bridge(object):
         @param name: The service name.
         @return: An opaque reference to a service.
         '''
-        return reference.Reference(self, ['named', name, name])
+        return self._reference(['named', name, name])
 
     def get_channel(self, name):
         '''Fetch a channel from Bridge.
@@ -148,10 +301,13 @@ class Bridge(object):
         @return: An opaque reference to a channel.
         '''
         # Send GETCHANNEL command in order to establih link for channel if client is not member
-        self._connection.send_command('GETCHANNEL', {'name': name})
-        return reference.Reference(self, ['channel', name, 'channel:' + name])
+        if name not in self._fetched_channels:
+            self._connection.send_command('GETCHANNEL', {'name': name})
+            self._fetched_channels.add(name)
+        return self._reference(['channel', name, 'channel:' + name])
 
-    def join_channel(self, name, handler, writeable=True, callback=None):
+    def join_channel(self, name, handler, writeable=True, callback=None, executor=None,
+            validators=None):
         '''Register a handler with a channel.
 
         @param name: The name of the channel.
@@ -159,13 +315,20 @@ class Bridge(object):
         @param writeable: Whether the handler's owner may write to the channel.
         @param callback: Called (with reference to channel, and name of channel) after the handler has been
         attached to the channel.
+        @param executor: Where handler methods run: 'inline' (the default),
+        'thread', 'process' or an executor instance.
+        @param validators: A dict of method name to a function called with
+        the arguments of each call to that method. Calls it raises for are
+        dropped.
         '''
         if hasattr(writeable, '__call__'):
             logging.warn('Deprecated -- the joinChannel API has been revised.')
             writeable, callback = True, writeable
+        self._set_executor('channel:' + name, executor)
+        self._validators['channel:' + name] = validators or {}
         data = {'name': name, 'handler': serializer.serialize(self, handler), 'writeable': writeable}
         if callback:
-            data['callback'] = serializer.serialize(self, callback)
+            data['callback'] = serializer.serialize(self, callback, once=True)
         self._connection.send_command('JOINCHANNEL', data)
 
     def leave_channel(self, name, handler, callback=None):
@@ -178,7 +341,7 @@ class Bridge(object):
         '''
         data = {'name': name, 'handler': serializer.serialize(self, handler)}
         if callback:
-            data['callback'] = serializer.serialize(self, callback)
+            data['callback'] = serializer.serialize(self, callback, once=True)
         self._connection.send_command('LEAVECHANNEL', data)
 
     def ready(self, func):
@@ -198,48 +361,325 @@ class Bridge(object):
         '''Entry point into the Bridge event loop.
 
         This function starts the event loop. It will eventually execute
-        handlers for the 'ready' event. It does not return.
+        handlers for the 'ready' event. It does not return, unless the
+        asyncio backend is used.
 
         @param callback: Called (with no arguments) after initialization.
+        @return: With the asyncio backend, a future resolved with this
+        bridge once it is ready.
         '''
         if callback:
             self.ready(callback)
+        if self._options['loop'] is not None:
+            from BridgePython import aio
+            future = aio.ready(self)
+            self._connection.start()
+            return future
         self._connection.start()
 
+    def once(self, func):
+        '''Wrap a callback so it is released after its first call.
+
+        @param func: The callback to wrap.
+        @return: A callback that may be passed in place of func.
+        '''
+        return serializer.Callback(func, once=True)
+
+    def release(self, ref):
+        '''Release a callback or object stored for the server.
+
+        Further calls to it from the server are ignored.
+
+        @param ref: A reference to a stored callback or object.
+        @return: True if the object was still stored.
+        '''
+        address = ref._address
+        if address[0] != 'client' or address[1] != self._connection.client_id:
+            return False
+        return self._store.release(address[2])
+
+    def store_stats(self):
+        '''Fetch counters describing stored callbacks and objects.
+
+        @return: A dict with the current size and stored, released, consumed,
+        evicted and expired counts.
+        '''
+        stats = dict(self._store.stats)
+        stats['size'] = len(self._store)
+        return stats
+
+    def send_stats(self):
+        '''Fetch counters describing outgoing socket writes.
+
+        @return: A dict with frames, bytes, writes, flushes, batched_frames
+        and compressed counts.
+        '''
+        return dict(self._connection.send_stats)
+
+    def request(self, method, *args, **kwargs):
+        '''Call a remote method and get a future for its reply.
+
+        A one-shot callback is passed as the last argument. The future
+        resolves with what the remote side calls it with, or a tuple when it
+        is called with several arguments. It fails with rpc.RequestTimeout,
+        rpc.TooManyRequests, or rpc.RequestFailed if the message is dropped
+        or the connection closes for good.
+
+        @param method: A method of a reference, such as service.fetch.
+        @param args: Arguments to the method.
+        @keyword timeout: Seconds to wait for the reply. Defaults to the
+        request_timeout option.
+        @return: A future.
+        '''
+        return self._requests.request(method._reference, method._op, args, kwargs.get('timeout'))
+
+    def drain(self):
+        '''Wait until the connection is writable.
+
+        @return: A future resolved once pending writes fall below the
+        write_low option, at once if they already are.
+        '''
+        return self._connection.drain()
+
+    def request_stats(self):
+        '''Fetch reply latency of requests made with request().
+
+        @return: A dict of 'service.method' to count, sum, min, max and
+        percentiles of the latency in seconds, plus 'inflight'.
+        '''
+        stats = dict(('%s.%s' % key, histogram.snapshot())
+            for key, histogram in self._requests.latency.items())
+        stats['inflight'] = self._requests.inflight
+        return stats
+
+    def get_metrics(self):
+        '''Fetch the metrics recorded by this bridge.
+
+        @return: A metrics.Metrics instance, or a metrics.NullMetrics when
+        the metrics option is not set. Pass it to metrics.prometheus or a
+        metrics.StatsdExporter to export it.
+        '''
+        return self._metrics
+
+    def close(self):
+        '''Disconnect from Bridge once queued messages have been written.
+
+        Reconnects are disabled. Requests still awaiting replies fail with
+        rpc.RequestFailed.
+        '''
+        self._connection.close()
+        if self._connection.sock is self._connection.sock_buffer:
+            # Never connected, so no disconnect is coming to fail them
+            self._requests.fail_all('Connection closed')
+
     def get_client(self, id):
-        return client.Client(self, id)
+        '''Returns the client with the given id, reused across calls.
+
+        @param id: The client id.
+        '''
+        found = self._clients.get(id)
+        if found is None:
+            if len(self._clients) >= 4096:
+                # Start over rather than track which clients are still around
+                self._clients.clear()
+            found = self._clients.setdefault(id, client.Client(self, id))
+        return found
 
     def context(self):
-        return self._context
+        '''Returns the client that sent the message being handled.
 
-    def _execute(self, address, args):
+        Works in coroutine handlers and on 'thread' executors. Returns None
+        outside a handler, or when the server did not say who sent it.
+        '''
+        source = self._source.get()
+        if source is None:
+            return None
+        return self.get_client(source)
+
+    def _reference(self, address):
+        # The same reference, and so the same method proxies, while in use
+        key = tuple(address)
+        ref = self._references.get(key)
+        if ref is None:
+            ref = self._references[key] = reference.Reference(self, address)
+        return ref
+
+    def _execute(self, address, args, source=None):
+        token = self._source.set(source)
+        try:
+            self._invoke(address, args)
+        finally:
+            self._source.reset(token)
+
+    def _invoke(self, address, args):
+        methods = self._dispatch.get(address[2])
+        handler = methods.get(address[3]) if methods is not None else None
+        if handler is None:
+            # Anonymous entries are not compiled
+            return self._execute_stored(address, args)
+        if not handler.accepts(args):
+            self._metrics.inc('rejected_calls')
+            return
+        if handler.executor is not None:
+            handler.executor.submit(self, handler.func, args)
+            return
+        timed = self._metrics.enabled
+        if timed:
+            start = time.time()
+        try:
+            result = handler.func(*args)
+            if hasattr(result, '__await__'):
+                # Coroutine handlers run as tasks on the loop
+                self._connection.spawn(result)
+        except:
+            traceback.print_exc()
+            logging.error('Exception while calling %s(%s)', address[3], args)
+            self._metrics.inc('handler_errors')
+        if timed:
+            self._metrics.timing('handler_seconds', time.time() - start, handler.labels)
+
+    def _execute_stored(self, address, args):
         # Retrieve stored handler
-        obj = self._store[address[2]]
+        obj = self._store.get(address[2])
         # Retrieve function in handler
         func = getattr(obj, address[3], None)
         if not func:
-            logging.warn('Could not find object to handle %s', '.'.join(address))
+            logging.warning('Could not find object to handle %s.%s', address[2], address[3])
+        elif address[2] in self._executors:
+            self._executors[address[2]].submit(self, func, args)
         else:
+            timed = self._metrics.enabled
+            if timed:
+                start = time.time()
             try:
-                func(*args)
+                result = func(*args)
+                if hasattr(result, '__await__'):
+                    # Coroutine handlers run as tasks on the loop
+                    self._connection.spawn(result)
             except:
                 traceback.print_exc()
                 logging.error('Exception while calling %s(%s)', address[3], args)
-
-    def _store_object(self, handler, ops):
+                self._metrics.inc('handler_errors')
+            finally:
+                self._store.consume(address[2])
+            if timed:
+                self._time_handler(address, time.time() - start)
+
+    def _time_handler(self, address, seconds):
+        # Anonymous callbacks share one label, their names are random
+        name = address[2] if self._store.is_named(address[2]) else 'callback'
+        self._metrics.timing('handler_seconds', seconds, (('handler', '%s.%s' % (name, address[3])),))
+
+    def _collect_metrics(self, metrics):
+        connection = self._connection
+        metrics.set('store_size', len(self._store))
+        for name, value in self._store.stats.items():
+            metrics.set('store_' + name, value)
+        metrics.set('buffer_depth', len(connection.sock_buffer.buffer))
+        metrics.set('write_buffer_bytes', connection.sock.write_buffer_size())
+        metrics.set('write_saturated', int(connection.saturated))
+        for name, value in connection.send_stats.items():
+            metrics.set('sent_' + name, value)
+        metrics.set('requests_inflight', self._requests.inflight)
+        for (service, op), histogram in self._requests.latency.items():
+            metrics.histograms[('request_seconds', (('method', '%s.%s' % (service, op)),))] = histogram
+
+    def _compile(self, name):
+        # Resolve every method of a named entry once, not per call
+        obj = self._store[name]
+        validators = self._validators.get(name, {})
+        executor = self._executors.get(name)
+        self._dispatch[name] = dict((op, _Handler(name, op, getattr(obj, op), executor, validators.get(op)))
+            for op in util.find_ops(obj))
+
+    def _set_executor(self, name, spec):
+        previous = self._executors.pop(name, None)
+        if previous is not None and previous is not spec:
+            previous.shutdown()
+        spec = executor.get_executor(spec, self._options)
+        if spec is not None:
+            self._executors[name] = spec
+
+    def _store_object(self, handler, ops, once=False):
+        # Callbacks are known by the function they wrap, unless one-shot
+        key = handler
+        if isinstance(handler, serializer.Callback) and not once:
+            key = handler.wrap[0]
+        if not once:
+            # Reuse the reference if this object is already stored
+            ref = self._store.reference(key)
+            if ref is not None:
+                return ref
         # Generate random id for callback being stored
         name = util.generate_guid()
-        self._store[name] = handler
         # Return reference to stored callback
-        return reference.Reference(self, ['client', self._connection.client_id, name], ops)
+        ref = reference.Reference(self, ['client', self._connection.client_id, name], ops)
+        if self._connection.client_id is None:
+            self._connection.unbound.append(ref)
+        self._store.add(name, handler, once, key, ref)
+        return ref
 
     def _send(self, args, destination):
+        if not self._connection.on_loop_thread():
+            # Serialize on the loop thread, the store is not thread safe
+            self._connection.wait_for_room(destination)
+            self._connection.loop.add_callback(self._send_later, args, destination)
+            return
         args = list(args)
         self._connection.send_command('SEND', {
             'args': serializer.serialize(self, args),
             'destination': destination,
         })
 
+    def _send_later(self, args, destination):
+        # Handed over by another thread, nobody is left to raise to
+        data = {
+            'args': serializer.serialize(self, list(args)),
+            'destination': destination,
+        }
+        try:
+            self._connection.send_command('SEND', data)
+        except (connection.BufferFull, connection.WriteBufferFull) as e:
+            logging.warning('Dropping message sent from another thread: %s', e)
+            self.emit('dropped', {'command': 'SEND', 'data': data})
+
+class _Handler(object):
+    # A compiled method of a named entry
+    __slots__ = ('name', 'func', 'executor', 'validator', 'labels', 'arity')
+
+    def __init__(self, name, op, func, executor, validator):
+        self.name = '%s.%s' % (name, op)
+        self.func = func
+        self.executor = executor
+        self.validator = validator
+        self.labels = (('handler', self.name),)
+        self.arity = None
+        try:
+            params = list(inspect.signature(func).parameters.values())
+        except (TypeError, ValueError):
+            return
+        positional = [p for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)]
+        required = len([p for p in positional if p.default is p.empty])
+        if any(p.kind == p.VAR_POSITIONAL for p in params):
+            self.arity = (required, None)
+        else:
+            self.arity = (required, len(positional))
+
+    def accepts(self, args):
+        if self.arity is not None:
+            low, high = self.arity
+            if len(args) < low or (high is not None and len(args) > high):
+                logging.warning('Dropping call to %s with %d arguments', self.name, len(args))
+                return False
+        if self.validator is not None:
+            try:
+                self.validator(*args)
+            except Exception as e:
+                logging.warning('Dropping call to %s: %s', self.name, e)
+                return False
+        return True
+
+
 class _SystemService(object):
     def __init__(self, bridge):
         self._bridge = bridge
@@ -247,6 +687,7 @@ class _SystemService(object):
     def hookChannelHandler(self, name, handler, func=None):
         # Store under channel name
         self._bridge._store['channel:' + name] = handler
+        self._bridge._compile('channel:' + name)
         if func:
             # Send callback with reference to channel and handler operations
             func(reference.Reference(self._bridge, ['channel', name, 'channel:' + name], util.find_ops(handler)), name)
@@ -1,7 +1,6 @@
-from BridgePython import serializer, reference
 
 class Client(object):
     def __init__(self, bridge, id):
         self.bridge, self.clientId = bridge, id;
     def get_service(self, svc):
-        return reference.Reference(self.bridge, ['client', self.clientId, svc])
+        return self.bridge._reference(['client', self.clientId, svc])
@@ -0,0 +1,209 @@
+import json
+
+from BridgePython.reference import RefDict
+
+'''
+Wire encoders. Every codec turns a message into UTF-8 JSON bytes and
+back. The fastest JSON library installed is used unless one is named.
+Binary codecs are only used once negotiated in the CONNECT handshake.
+Codecs may also offer decode_many, decoding a list of frames in one call.
+
+Codecs with supports_hook convert refs while parsing. orjson and ujson
+take no object hook, so with either of them, orjson being the default when
+installed, the arguments of messages holding refs are still walked after
+decoding.
+'''
+
+
+def _join(frames):
+    # Frames received together, as a single JSON array
+    return b'[' + b','.join(frames) + b']'
+
+
+class JsonCodec(object):
+    name = 'json'
+    # Whether decode accepts an object_hook
+    supports_hook = True
+
+    def encode(self, val):
+        return json.dumps(val, default=str).encode('utf-8')
+
+    def decode(self, data, object_hook=None):
+        return json.loads(data, object_hook=object_hook)
+
+    def decode_many(self, frames, object_hook=None):
+        return json.loads(_join(frames), object_hook=object_hook)
+
+
+class OrjsonCodec(object):
+    name = 'orjson'
+    # orjson has no object_hook, refs are converted after decoding
+    supports_hook = False
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+        self._loads = orjson.loads
+        self._option = orjson.OPT_NON_STR_KEYS
+        self._fallback = JsonCodec()
+
+    def encode(self, val):
+        try:
+            return self._dumps(val, default=str, option=self._option)
+        except TypeError:
+            # orjson refuses integers wider than 64 bits
+            return self._fallback.encode(val)
+
+    def decode(self, data):
+        return self._loads(data)
+
+    def decode_many(self, frames):
+        return self._loads(_join(frames))
+
+
+class UjsonCodec(object):
+    name = 'ujson'
+    # Nor has ujson
+    supports_hook = False
+
+    def __init__(self):
+        import ujson
+        self._dumps = ujson.dumps
+        self._loads = ujson.loads
+
+    def encode(self, val):
+        return self._dumps(val, default=str).encode('utf-8')
+
+    def decode(self, data):
+        return self._loads(data)
+
+    def decode_many(self, frames):
+        return self._loads(_join(frames))
+
+
+class RapidjsonCodec(object):
+    name = 'rapidjson'
+    supports_hook = True
+
+    def __init__(self):
+        import rapidjson
+        self._dumps = rapidjson.dumps
+        self._loads = rapidjson.loads
+
+    def encode(self, val):
+        return self._dumps(val, default=str).encode('utf-8')
+
+    def decode(self, data, object_hook=None):
+        return self._loads(data, object_hook=object_hook)
+
+    def decode_many(self, frames, object_hook=None):
+        return self._loads(_join(frames), object_hook=object_hook)
+
+
+class MsgpackCodec(object):
+    '''MessagePack, carrying bytes values as is.
+
+    Serialized references (reference.RefDict) are packed as an extension
+    type holding [address, operations] and unpacked to RefDict again, or
+    passed through object_hook when one is given.
+    '''
+
+    name = 'msgpack'
+    supports_hook = True
+    binary = True
+    ref_code = 1
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+        self._packer = msgpack.Packer(default=self._default, use_bin_type=True,
+                strict_types=True, autoreset=True)
+
+    def _default(self, obj):
+        if type(obj) is RefDict:
+            if 'operations' in obj:
+                payload = [obj['ref'], obj['operations']]
+            else:
+                payload = [obj['ref']]
+            return self._msgpack.ExtType(self.ref_code, self._msgpack.packb(payload, use_bin_type=True))
+        # strict_types leaves subclasses and tuples to us
+        if isinstance(obj, dict):
+            return dict(obj)
+        if isinstance(obj, (list, tuple)):
+            return list(obj)
+        return str(obj)
+
+    def encode(self, val):
+        return self._packer.pack(val)
+
+    def decode(self, data, object_hook=None):
+        ext_hook = lambda code, payload: self._ext_hook(code, payload, object_hook)
+        return self._msgpack.unpackb(data, raw=False, ext_hook=ext_hook, strict_map_key=False)
+
+    def decode_many(self, frames, object_hook=None):
+        ext_hook = lambda code, payload: self._ext_hook(code, payload, object_hook)
+        unpacker = self._msgpack.Unpacker(raw=False, ext_hook=ext_hook,
+                strict_map_key=False)
+        unpacker.feed(b''.join(frames))
+        return list(unpacker)
+
+    def _ext_hook(self, code, payload, object_hook=None):
+        if code != self.ref_code:
+            return self._msgpack.ExtType(code, payload)
+        payload = self._msgpack.unpackb(payload, raw=False)
+        obj = RefDict(ref=payload[0])
+        if len(payload) > 1:
+            obj['operations'] = payload[1]
+        return object_hook(obj) if object_hook else obj
+
+
+codecs = {
+    'orjson': OrjsonCodec,
+    'ujson': UjsonCodec,
+    'rapidjson': RapidjsonCodec,
+    'json': JsonCodec,
+}
+
+# Order in which codecs are tried when none is named
+preference = ['orjson', 'rapidjson', 'ujson', 'json']
+
+# Encodings that may be negotiated at CONNECT
+binary_codecs = {
+    'msgpack': MsgpackCodec,
+}
+
+
+def get_codec(codec=None):
+    '''Returns a codec instance.
+
+    codec may be a codec name, an object with encode and decode methods, or
+    None to pick the fastest installed codec.
+    '''
+    if codec is None or codec == 'auto':
+        for name in preference:
+            try:
+                return codecs[name]()
+            except ImportError:
+                pass
+    if codec in codecs:
+        return codecs[codec]()
+    if codec in binary_codecs:
+        return binary_codecs[codec]()
+    if isinstance(codec, str):
+        raise ValueError('Unknown codec: %s' % codec)
+    return codec
+
+
+def available_encodings(names):
+    '''Returns those of names whose binary codec can be loaded.'''
+    available = []
+    for name in names:
+        try:
+            binary_codecs[name]()
+        except (KeyError, ImportError):
+            continue
+        available.append(name)
+    return available
+
+
+default = get_codec()
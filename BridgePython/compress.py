@@ -0,0 +1,99 @@
+import zlib
+
+'''
+Frame compression. Frames at least compress_threshold bytes long are
+compressed with the algorithm agreed at CONNECT, and flagged with the
+high bit of their length header. Frames of compress_offload bytes or more
+are compressed and decompressed on a worker thread.
+'''
+
+# Set in the length header of compressed frames
+FLAG = 0x80000000
+SIZE_MASK = 0x7fffffff
+
+
+class ZlibCompressor(object):
+    name = 'zlib'
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class ZstdCompressor(object):
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data):
+        # Frames written by compress carry their content size
+        return self._decompressor.decompress(data)
+
+
+class Lz4Compressor(object):
+    name = 'lz4'
+
+    def __init__(self):
+        import lz4.frame
+        self._frame = lz4.frame
+
+    def compress(self, data):
+        return self._frame.compress(data)
+
+    def decompress(self, data):
+        return self._frame.decompress(data)
+
+
+compressors = {
+    'zstd': ZstdCompressor,
+    'lz4': Lz4Compressor,
+    'zlib': ZlibCompressor,
+}
+
+# Order in which compressors are proposed when none is named
+preference = ['zstd', 'lz4', 'zlib']
+
+
+def get_compressor(name):
+    if name in compressors:
+        return compressors[name]()
+    return name
+
+
+def available_compressors(names):
+    '''Returns those of names whose compressor can be loaded.'''
+    if names is True:
+        names = preference
+    available = []
+    for name in names:
+        try:
+            compressors[name]()
+        except (KeyError, ImportError):
+            continue
+        available.append(name)
+    return available
+
+
+class CompressedFrame(bytes):
+    '''A frame received with the compressed flag set.'''
+
+
+_pool = []
+
+def offload(func, *args):
+    '''Runs func on the shared worker pool, returning a concurrent future.'''
+    if not _pool:
+        from concurrent.futures import ThreadPoolExecutor
+        _pool.append(ThreadPoolExecutor(2))
+    return _pool[0].submit(func, *args)
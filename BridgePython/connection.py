@@ -1,16 +1,21 @@
+import os
 import sys
 import json
+import time
+import random
+import hashlib
 import struct
 import socket
 import logging
+import threading
 from collections import deque
 from datetime import timedelta
 
-from tornado import ioloop, iostream
+from tornado import ioloop, iostream, gen, concurrent
 from tornado.escape import native_str
-from tornado.httpclient import HTTPClient, HTTPError
+from tornado.httpclient import AsyncHTTPClient
 
-from BridgePython import util, serializer, tcp, client
+from BridgePython import util, serializer, tcp, codec, compress
 
 class Connection(object):
     def __init__(self, bridge):
@@ -19,75 +24,200 @@ class Connection(object):
 
         self.options = bridge._options
 
+        # Wire encoding, JSON until a binary one is negotiated
+        self.json_codec = codec.get_codec(self.options['codec'])
+        self.use_codec(self.json_codec)
+        encodings = self.options['encoding'] or []
+        if not isinstance(encodings, (list, tuple)):
+            encodings = [encodings]
+        self.encodings = codec.available_encodings(encodings)
+        if len(self.encodings) < len(encodings):
+            logging.warning('Encodings unavailable, not proposed: %s',
+                    ', '.join(set(encodings) - set(self.encodings)))
+        compression = self.options['compression'] or []
+        if not isinstance(compression, (list, tuple, bool)):
+            compression = [compression]
+        self.compressions = compress.available_compressors(compression)
+
         # Preconnect buffer
-        self.sock_buffer = SockBuffer()
+        self.sock_buffer = SockBuffer(self)
         self.sock = self.sock_buffer
         
         # Create IO loop
-        self.loop = ioloop.IOLoop.instance()
+        if self.options['loop'] is None:
+            self.loop = ioloop.IOLoop.instance()
+            self.transport = tcp.Tcp
+        else:
+            from BridgePython import aio
+            loop = self.options['loop']
+            self.loop = aio.AsyncioLoop(None if loop == 'asyncio' else loop)
+            self.transport = aio.AsyncioTcp
+        # Set once the loop runs, sends from other threads are handed to it
+        self.loop_thread = None
+
+        # Set while more than write_high bytes are waiting to be sent
+        self.saturated = False
+        self.writable = threading.Condition()
+        self.drain_waiters = []
+
+        # Executors that asked to stop reading, and frames held meanwhile
+        self.pausers = set()
+        self.backlog = deque()
+        # Messages decoded from the backlog, with whether they hold refs
+        self.parsed = deque()
+        # Set while the rest of the backlog waits for the next iteration
+        self.yielded = False
         
         # Connection configuration
-        self.interval = 400
+        self.policy = self.options['reconnect_policy'] or ReconnectPolicy(
+            self.options['reconnect_base'], self.options['reconnect_cap'],
+            self.options['reconnect_jitter'], self.options['reconnect_attempts'])
+        self.attempts = 0
         self.client_id = None
         self.secret = None
+
+        # Host and port come from the redirector unless both are given
+        self.redirected = not (self.options.get('host') and self.options.get('port'))
+        self.endpoint_time = 0
+        self.endpoints = EndpointCache(self.options['redirector_cache'])
+
+        # References to stored objects made before the client id was known
+        self.unbound = []
+
+        # Set by close, and the socket opened while the handshake runs
+        self.closed = False
+        self.opening = None
+
+        # Outbound write counters
+        self.send_stats = {
+            'frames': 0,
+            'bytes': 0,
+            'writes': 0,
+            'flushes': 0,
+            'batched_frames': 0,
+            'compressed': 0,
+        }
         
     # Contact redirector for host and port
     def redirector(self):
-        client = HTTPClient()
+        url = '%s/redirect/%s' % (self.options['redirector'], self.options['api_key'])
+        key = EndpointCache.key(self.options['redirector'], self.options['api_key'])
+        entry = self.endpoints.get(key)
+        if entry and time.time() - entry[2] < self.options['redirector_ttl']:
+            logging.info('Using cached endpoint %s:%s', entry[0], entry[1])
+            self.use_endpoint(entry)
+            return
+        future = AsyncHTTPClient().fetch(url, request_timeout=self.options['redirector_timeout'])
+        self.loop.add_future(future, lambda future: self.onredirect(key, future))
+
+    def onredirect(self, key, future):
         try:
-            res = client.fetch('%s/redirect/%s' % (
-                self.options['redirector'], self.options['api_key']
-            ))
+            res = future.result()
         except:
             logging.error('Unable to contact redirector')
-            client.close()
+            self.redirect_failed(key)
             return
 
         try:
             body = util.parse(res.body).get('data')
         except:
             logging.error('Unable to parse redirector response %s', res.body)
+            self.redirect_failed(key)
             return
 
         if not ('bridge_port' in body and 'bridge_host' in body):
             logging.error('Could not find host and port in JSON body')
+            self.redirect_failed(key)
+        else:
+            self.use_endpoint(self.endpoints.put(key, body.get('bridge_host'),
+                int(body.get('bridge_port'))))
+
+    def redirect_failed(self, key):
+        entry = self.endpoints.get(key)
+        if entry:
+            # Fall back to the last endpoint the redirector gave us
+            logging.warning('Using last known endpoint %s:%s', entry[0], entry[1])
+            self.use_endpoint(entry)
+        elif self.options['reconnect']:
+            self.reconnect()
+
+    def endpoint_failed(self):
+        logging.warning('Unable to connect to %s:%s', self.options['host'], self.options['port'])
+        self.endpoint_time = 0
+        # Still the fallback if the redirector cannot be reached
+        self.endpoints.expire(EndpointCache.key(self.options['redirector'], self.options['api_key']))
+
+    def use_endpoint(self, entry):
+        self.options['host'], self.options['port'], self.endpoint_time = entry
+        self.establish_connection()
+
+    def resolve(self):
+        # Ask the redirector again once its answer is older than the ttl
+        if self.redirected and time.time() - self.endpoint_time >= self.options['redirector_ttl']:
+            self.redirector()
         else:
-            self.options['host'] = body.get('bridge_host')
-            self.options['port'] = int(body.get('bridge_port'))
             self.establish_connection()
-        client.close()
 
     def reconnect(self):
-        logging.info('Attempting reconnect')
-        if self.interval < 32678:
-            delta = timedelta(milliseconds=self.interval)
-            self.loop.add_timeout(delta, self.establish_connection)
-            # Grow timeout for next reconnect attempt
-            self.interval *= 2
+        max_attempts = self.policy.max_attempts
+        if max_attempts is not None and self.attempts >= max_attempts:
+            logging.error('Giving up after %d reconnect attempts', self.attempts)
+            self.bridge.emit('reconnect_failed')
+            return
+        delay = self.policy.delay(self.attempts)
+        logging.info('Attempting reconnect in %dms', delay)
+        self.loop.add_timeout(timedelta(milliseconds=delay), self.resolve)
+        self.attempts += 1
 
     def establish_connection(self):
+        if self.closed:
+            return
         # Set onmessage handler to handle CONNECT response
         logging.info('Starting TCP connection %s, %s', self.options['host'], self.options['port'])
 
         self.onmessage = self.onconnectmessage
-        tcp.Tcp(self)
+        self.transport(self)
   
+    def use_codec(self, impl):
+        self.codec = impl
+        self.binary = getattr(impl, 'binary', False)
+        self.hook = None
+        if getattr(impl, 'supports_hook', False):
+            self.hook = serializer.ref_hook(self.bridge)
+
     def onconnectmessage(self, message, sock):
         logging.info('Received clientId and secret')
-        # Parse for client id and secret
-        ids = message['data'].split('|')
-        if len(ids) != 2:
+        # Parse for client id, secret, and the encoding and compression the
+        # server chose
+        ids = native_str(message['data']).split('|')
+        if len(ids) not in (2, 3, 4):
             # Handle message normally if not a correct CONNECT response
             self.process_message(message, sock)
         else:
             logging.info('client_id received, %s', ids[0])
-            self.client_id, self.secret = ids
-            # Reset reconnect interval
-            self.interval = 400
-            # Send preconnect queued messages
-            self.sock.process_queue(sock, self.client_id)
-            # Set connection socket to connected socket
-            self.sock = sock
+            if self.client_id is not None and ids[0] != self.client_id:
+                # A new session, channels have to be fetched again
+                self.bridge._fetched_channels.clear()
+            self.client_id, self.secret = ids[:2]
+            ids += [''] * (4 - len(ids))
+            if ids[2] in self.encodings:
+                logging.info('Using %s encoding', ids[2])
+                self.use_codec(codec.get_codec(ids[2]))
+            elif ids[2] not in ('', 'json'):
+                logging.error('Server chose unknown encoding %s', ids[2])
+            if ids[3] in self.compressions:
+                logging.info('Using %s compression', ids[3])
+                sock.compressor = compress.get_compressor(ids[3])
+            elif ids[3]:
+                logging.error('Server chose unknown compression %s', ids[3])
+            # Reset reconnect backoff
+            self.attempts = 0
+            # Fill in the client id of references made before the handshake
+            for ref in self.unbound:
+                ref._bind(self.client_id)
+            self.unbound = []
+            # Send preconnect queued messages, then switch to the socket
+            self.sock_buffer.process_queue(sock)
             # Set onmessage handler to handle standard messages
             self.onmessage = self.process_message
             logging.info('Handshake complete')
@@ -95,67 +225,436 @@ class Connection(object):
             if not self.bridge._ready:
               self.bridge._ready = True
               self.bridge.emit('ready')
+            else:
+              self.bridge.emit('reconnect')
+
+    def onframes(self, frames, sock):
+        self.backlog.extend(frames)
+        self.process_backlog(sock)
+
+    def process_backlog(self, sock):
+        # Handle buffered frames until none are left, an executor asks to
+        # stop reading or the inbound budget for this loop iteration is spent
+        if self.yielded:
+            return
+        budget = self.options['inbound_budget']
+        deadline = self.loop.time() + budget / 1000.0 if budget else None
+        handled = 0
+        while (self.backlog or self.parsed) and not self.pausers:
+            if self.parsed:
+                self.dispatch(*self.parsed.popleft())
+            elif self.onmessage == self.process_message:
+                self.parse_backlog()
+                continue
+            else:
+                # onmessage changes once the handshake completes
+                self.onmessage({'data': self.backlog.popleft()}, sock)
+            handled += 1
+            if deadline is not None and (self.backlog or self.parsed) and self.loop.time() >= deadline:
+                # Let writes and timers run before handling the rest
+                self.yielded = True
+                self.sock.pause()
+                self.loop.add_callback(self.resume_backlog)
+                break
+        metrics = self.bridge._metrics
+        if handled and metrics.enabled:
+            metrics.histogram('inbound_batch', bounds=metrics.count_bounds).observe(handled)
+
+    def parse_backlog(self):
+        # Decode every buffered frame at once, one at a time if that fails
+        frames = list(self.backlog)
+        self.backlog.clear()
+        for data in frames:
+            self.received(data)
+        # As in process_message, refs are converted while parsing when the
+        # codec takes a hook, and by walking the arguments otherwise, as
+        # with orjson, the default
+        binary = self.binary
+        refs = [binary or data.count(b'"ref"') > 1 for data in frames]
+        hook = self.hook if any(refs) else None
+        objs = None
+        if len(frames) > 1 and hasattr(self.codec, 'decode_many'):
+            try:
+                if hook:
+                    objs = self.codec.decode_many(frames, hook)
+                else:
+                    objs = self.codec.decode_many(frames)
+            except Exception:
+                objs = None
+            if objs is not None and len(objs) != len(frames):
+                objs = None
+        if objs is None:
+            objs = []
+            for data, has_refs in zip(frames, refs):
+                try:
+                    if has_refs and hook:
+                        objs.append(self.codec.decode(data, hook))
+                    else:
+                        objs.append(self.codec.decode(data))
+                except Exception:
+                    logging.error('Message parsing failed')
+                    self.bridge._metrics.inc('parse_errors')
+                    objs.append(None)
+        for obj, has_refs in zip(objs, refs):
+            if obj is not None:
+                self.parsed.append((obj, has_refs and not hook))
+
+    def resume_backlog(self):
+        self.yielded = False
+        self.process_backlog(self.sock)
+        if not self.yielded and not self.pausers:
+            self.sock.resume()
+
+    def pause_reading(self, source):
+        if not self.pausers:
+            logging.info('Pausing reads')
+            self.sock.pause()
+        self.pausers.add(source)
+
+    def resume_reading(self, source):
+        if source not in self.pausers:
+            return
+        self.pausers.discard(source)
+        self.process_backlog(self.sock)
+        if not self.pausers and not self.yielded:
+            logging.info('Resuming reads')
+            self.sock.resume()
+
+    def spawn(self, awaitable):
+        # Run a coroutine returned by a handler on the loop
+        if hasattr(self.loop, 'spawn'):
+            future = self.loop.spawn(awaitable)
+        else:
+            future = gen.convert_yielded(awaitable)
+        self.loop.add_future(future, self.ontask)
+
+    def ontask(self, future):
+        if future.exception() is not None:
+            logging.error('Exception in coroutine handler: %s', future.exception())
+
+    def create_future(self):
+        if hasattr(self.loop, 'create_future'):
+            return self.loop.create_future()
+        return concurrent.Future()
+
+    def on_loop_thread(self):
+        # Unknown until the loop has run a callback
+        return self.loop_thread is threading.current_thread()
+
+    def received(self, data):
+        if self.bridge._trace is not None:
+            self.bridge._trace.received(data)
+        metrics = self.bridge._metrics
+        if metrics.enabled:
+            metrics.inc('messages_received')
+            metrics.inc('bytes_received', len(data) + 4)
 
     def process_message(self, message, sock):
-        logging.info('Received %s', message['data'])
+        data = message['data']
+        self.received(data)
+        # The destination is the only ref in JSON messages without ref
+        # arguments, binary codecs only call the hook on refs
+        has_refs = self.binary or data.count(b'"ref"') > 1
         try:
-            obj = util.parse(message['data'])
+            if has_refs and self.hook:
+                # Convert serialized ref objects while parsing
+                obj = self.codec.decode(data, self.hook)
+                has_refs = False
+            else:
+                obj = self.codec.decode(data)
         except:
             logging.error('Message parsing failed')
+            self.bridge._metrics.inc('parse_errors')
             return
-        # Convert serialized ref objects to callable references
-        serializer.unserialize(self.bridge, obj['args'])
+        self.dispatch(obj, has_refs)
+
+    def dispatch(self, obj, has_refs):
+        if has_refs:
+            # Convert serialized ref objects to callable references
+            serializer.unserialize(self.bridge, obj['args'])
         # Extract RPC destination address
         destination = obj.get('destination', None)
         if not destination:
             logging.warning('No destination in message %s', obj)
             return
-        if 'source' in message:
-            self.bridge._context = client.Client(message['source'])
-        self.bridge._execute(destination['ref'], obj['args'])
+        self.bridge._execute(destination['ref'], obj['args'], obj.get('source'))
    
     def onopen(self, sock):
+        if self.closed:
+            # Closed while connecting
+            sock.close()
+            return
+        self.opening = sock
         logging.info('Beginning handshake')
-        msg = util.stringify({
-            'command': 'CONNECT',
-            'data': {
-                'session': [self.client_id, self.secret],
-                'api_key': self.options['api_key'],
-            }
-        })
-        sock.send(native_str(msg))
+        # Every connection starts out in JSON
+        self.use_codec(self.json_codec)
+        data = {
+            'session': [self.client_id, self.secret],
+            'api_key': self.options['api_key'],
+        }
+        if self.encodings:
+            data['encodings'] = self.encodings
+        if self.compressions:
+            data['compression'] = self.compressions
+        msg = self.codec.encode({'command': 'CONNECT', 'data': data})
+        sock.send(msg)
    
+    def onsaturated(self):
+        logging.info('Write buffer above %d bytes', self.options['write_high'])
+        self.saturated = True
+
+    def ondrained(self):
+        if not self.saturated:
+            return
+        self.saturated = False
+        with self.writable:
+            self.writable.notify_all()
+        waiters, self.drain_waiters = self.drain_waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+        self.bridge.emit('drain')
+
+    def drain(self):
+        future = self.create_future()
+        if self.saturated:
+            self.drain_waiters.append(future)
+        else:
+            future.set_result(None)
+        return future
+
+    def wait_for_room(self, destination=None):
+        # Called from other threads before handing a send to the loop
+        self.sock_buffer.wait_for_room()
+        if destination is None or not self.saturated:
+            return
+        policy = self.options['write_policy']
+        if policy == 'error':
+            raise WriteBufferFull('Write buffer above %d bytes' % self.options['write_high'])
+        if policy == 'block':
+            with self.writable:
+                while self.saturated:
+                    self.writable.wait()
+
     def onclose(self):
         # Restore preconnect buffer as socket connection
         logging.warning('Connection closed')
         self.sock = self.sock_buffer
+        self.opening = None
+        self.sock_buffer.target = None
+        if self.redirected and not self.closed and self.onmessage == self.onconnectmessage:
+            # Never got through, so ask the redirector before trying again
+            self.endpoint_failed()
+        # Sends are buffered again, let blocked senders through
+        self.ondrained()
+        self.bridge.emit('disconnect')
         if self.options['reconnect']:
             self.reconnect()
 
+    def onflushed(self, sock):
+        # Set connection socket to connected socket
+        self.sock = sock
+        self.opening = None
+        self.sock_buffer.notify()
+        if self.closed:
+            # Closed while queued messages were being flushed
+            sock.close()
+
     def send_command(self, command, data):
-        msg = util.stringify({'command': command, 'data': data})
-        logging.info('Sending %s', msg)
-        self.sock.send(native_str(msg))
+        if not self.on_loop_thread():
+            self.wait_for_room(data.get('destination') if command == 'SEND' else None)
+            self.loop.add_callback(self.send_command, command, data)
+            return
+        if self.sock is self.sock_buffer:
+            # Encoded once connected, when client ids are known
+            self.sock_buffer.queue(command, data)
+            return
+        if self.saturated and command == 'SEND':
+            policy = self.options['write_policy']
+            if policy == 'drop' and data['destination']['ref'][0] == 'channel':
+                logging.warning('Write buffer full, dropping channel message')
+                self.bridge._metrics.inc('dropped_sends')
+                self.bridge.emit('dropped', {'command': command, 'data': data})
+                return
+            if policy == 'error':
+                raise WriteBufferFull('Write buffer above %d bytes' % self.options['write_high'])
+        msg = self.codec.encode({'command': command, 'data': data})
+        if self.bridge._trace is not None:
+            self.bridge._trace.sent(msg)
+        self.sock.send(msg)
+
+    def open(self):
+        # Connect without running the loop
+        self.resolve()
+        self.loop.add_callback(self.onloop)
+
+    def onloop(self):
+        self.loop_thread = threading.current_thread()
+
+    def close(self):
+        # Stop reconnecting and close once queued messages are written
+        self.options['reconnect'] = False
+        self.closed = True
+        if self.sock is not self.sock_buffer:
+            self.sock.close()
+        elif self.opening is not None and self.sock_buffer.target is None:
+            # The handshake has not completed, nothing was queued to it yet
+            self.opening.close()
 
     def start(self):
-        if not (self.options.get('host') and self.options.get('port')):
-            self.redirector()
-        else:
-            # Host and port are specified
-            self.establish_connection()
+        self.open()
         self.loop.start()
 
+class EndpointCache(object):
+    '''Remembers redirector answers, in memory and optionally in a file.
+
+    Entries are keyed by redirector and a hash of the api key, so the key
+    itself is neither kept nor written out.
+    '''
+
+    # Shared by every connection in the process
+    memory = {}
+
+    def __init__(self, path=None):
+        self.path = path
+
+    @staticmethod
+    def key(redirector, api_key):
+        digest = hashlib.sha256(str(api_key).encode('utf-8')).hexdigest()
+        return '%s#%s' % (redirector, digest)
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.path:
+            entry = self.load().get(key)
+            if entry is not None:
+                entry = self.memory[key] = tuple(entry)
+        return entry
+
+    def put(self, key, host, port, updated=None):
+        entry = self.memory[key] = (host, port, time.time() if updated is None else updated)
+        if self.path:
+            entries = self.load()
+            entries[key] = entry
+            tmp = '%s.%d' % (self.path, os.getpid())
+            try:
+                # Only readable by the owner
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(entries, f)
+                os.rename(tmp, self.path)
+            except (IOError, OSError):
+                logging.warning('Unable to write endpoint cache %s', self.path)
+        return entry
+
+    def expire(self, key):
+        # Kept for redirect_failed, but no longer used without asking
+        entry = self.get(key)
+        if entry is not None:
+            self.put(key, entry[0], entry[1], 0)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+
+class ReconnectPolicy(object):
+    '''Exponential reconnect backoff, in milliseconds.
+
+    Delays double from base up to cap and stay at cap. Each delay is
+    shortened by a random fraction of up to jitter, so clients dropped
+    together do not reconnect together. Gives up after max_attempts
+    attempts if set.
+    '''
+
+    def __init__(self, base=400, cap=32768, jitter=0.5, max_attempts=None):
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+
+    def delay(self, attempt):
+        delay = self.cap if attempt >= 32 else min(self.cap, self.base * 2 ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+
+class BufferFull(Exception):
+    '''Raised when a message is sent while the preconnect buffer is full.'''
+
+
+class WriteBufferFull(Exception):
+    '''Raised when a message is sent while the write buffer is full.'''
+
+
 class SockBuffer (object):
-    def __init__(self):
-        # Buffer for preconnect messages
+    def __init__(self, connection):
+        self.connection = connection
+        # Buffer for preconnect commands, encoded when flushed
         self.buffer = deque()
+        # Socket the buffer is being flushed to
+        self.target = None
+        # Signalled when the buffer is drained, for blocked senders
+        self.drained = threading.Condition()
         
-    def send(self, msg):
-        self.buffer.append(native_str(msg))
-        
-    def process_queue(self, sock, client_id):
-        while len(self.buffer):
-            # Replace null client ids with actual client_id after handshake
-            sock.send(self.buffer.popleft().replace('"client", null', '"client", "' + client_id + '"'))
-        self.buffer = deque()
+    def queue(self, command, data):
+        options = self.connection.options
+        limit = options['buffer_limit']
+        if limit is not None and len(self.buffer) >= limit:
+            if options['buffer_policy'] == 'drop':
+                logging.warning('Preconnect buffer full, dropping message')
+                self.connection.bridge.emit('dropped', {'command': command, 'data': data})
+                return
+            # The loop thread cannot wait for itself, so blocking raises too
+            raise BufferFull('Preconnect buffer holds %d messages' % len(self.buffer))
+        self.buffer.append((command, data))
+
+    def wait_for_room(self):
+        # Called from other threads before handing a send to the loop
+        options = self.connection.options
+        limit = options['buffer_limit']
+        if limit is None or options['buffer_policy'] != 'block':
+            return
+        with self.drained:
+            while len(self.buffer) >= limit and self.connection.sock is self:
+                self.drained.wait()
+
+    def notify(self):
+        with self.drained:
+            self.drained.notify_all()
+
+    def write_buffer_size(self):
+        return 0
+
+    def pause(self):
+        if self.target is not None:
+            self.target.pause()
+
+    def resume(self):
+        if self.target is not None:
+            self.target.resume()
         
+    def process_queue(self, sock):
+        self.target = sock
+        self.flush(sock)
+
+    def flush(self, sock):
+        if self.target is not sock:
+            # Disconnected while flushing
+            return
+        encode = self.connection.codec.encode
+        trace = self.connection.bridge._trace
+        # Flush a bounded batch per loop iteration so reads are not starved
+        for i in range(min(len(self.buffer), self.connection.options['buffer_flush'])):
+            command, data = self.buffer.popleft()
+            msg = encode({'command': command, 'data': data})
+            if trace is not None:
+                trace.sent(msg)
+            sock.send(msg)
+        if self.buffer:
+            self.connection.loop.add_callback(self.flush, sock)
+        else:
+            self.target = None
+            self.connection.onflushed(sock)
@@ -0,0 +1,168 @@
+import logging
+import contextvars
+from concurrent.futures import BrokenExecutor
+
+from BridgePython import reference
+
+'''
+Executors decide where service handlers run. Handlers run inline on the
+IOLoop by default; thread and process pools keep slow handlers from
+stalling socket I/O.
+'''
+
+
+class PoolExecutor(object):
+    '''Base for executors backed by a concurrent.futures pool.
+
+    At most max_queue calls may be waiting or running. Reading from the
+    socket is paused while the queue is full.
+    '''
+
+    def __init__(self, workers=4, max_queue=100):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.pool = None
+
+    def submit(self, bridge, func, args):
+        if self.pool is None:
+            self.pool = self.create_pool()
+        connection = bridge._connection
+        self.pending += 1
+        if self.pending >= self.max_queue:
+            connection.pause_reading(self)
+        try:
+            future = self.run(func, args)
+        except Exception as e:
+            self.pending -= 1
+            if self.pending < self.max_queue:
+                connection.resume_reading(self)
+            if isinstance(e, BrokenExecutor):
+                # Start a new pool for the next call
+                self.pool = None
+            logging.error('Unable to call %s(%s): %s', getattr(func, '__name__', func), args, e)
+            return
+        # Done callbacks fire on the worker thread, so hop back to the loop
+        future.add_done_callback(lambda future:
+            connection.loop.add_callback(self.done, bridge, func, args, future))
+
+    def done(self, bridge, func, args, future):
+        self.pending -= 1
+        if self.pending < self.max_queue:
+            bridge._connection.resume_reading(self)
+        if future.exception() is not None:
+            logging.error('Exception while calling %s(%s): %s',
+                    getattr(func, '__name__', func), args, future.exception())
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+class ThreadExecutor(PoolExecutor):
+    '''Runs handlers on a thread pool.
+
+    Calls handlers make on references are sent from the IOLoop thread.
+    Handlers run in a copy of the caller's context, so Bridge.context()
+    works in them.
+    '''
+
+    def create_pool(self):
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(self.workers)
+
+    def run(self, func, args):
+        return self.pool.submit(contextvars.copy_context().run, func, *args)
+
+
+class ProcessExecutor(PoolExecutor):
+    '''Runs handlers in a process pool.
+
+    The handler object is pickled with every call. References and callbacks
+    in the arguments are replaced by proxies that record calls made on them,
+    which are replayed from the IOLoop once the handler returns.
+    '''
+
+    def create_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(self.workers)
+
+    def run(self, func, args):
+        targets = []
+        args = _strip(args, targets)
+        handler = getattr(func, '__self__', None)
+        if handler is None:
+            # Plain functions and static methods are pickled as they are
+            future = self.pool.submit(_run_in_process, func, None, args)
+        else:
+            future = self.pool.submit(_run_in_process, handler, func.__name__, args)
+        future.targets = targets
+        return future
+
+    def done(self, bridge, func, args, future):
+        PoolExecutor.done(self, bridge, func, args, future)
+        if future.exception() is not None:
+            return
+        for index, op, call_args in future.result():
+            target = future.targets[index]
+            if isinstance(target, reference.Reference):
+                target._call(op, call_args)
+            else:
+                target(*call_args)
+
+
+def get_executor(executor, options):
+    '''Returns an executor for a name or executor instance.'''
+    if executor is None or executor == 'inline':
+        return None
+    if executor == 'thread':
+        return ThreadExecutor(options['executor_workers'], options['executor_queue'])
+    if executor == 'process':
+        return ProcessExecutor(options['executor_workers'], options['executor_queue'])
+    return executor
+
+
+class _Proxy(object):
+    # Stands in for a reference or callback inside a worker process
+    def __init__(self, index):
+        self._index = index
+        self._calls = None
+
+    def __call__(self, *args):
+        self._calls.append((self._index, 'callback', args))
+
+    def __getattr__(self, op):
+        if op.startswith('__'):
+            raise AttributeError(op)
+        return lambda *args: self._calls.append((self._index, op, args))
+
+
+def _strip(obj, targets):
+    if type(obj) in (list, tuple):
+        return [_strip(val, targets) for val in obj]
+    elif type(obj) is dict:
+        return dict((key, _strip(val, targets)) for key, val in obj.items())
+    elif isinstance(obj, reference.Reference) or callable(obj):
+        targets.append(obj)
+        return _Proxy(len(targets) - 1)
+    return obj
+
+
+def _run_in_process(handler, name, args):
+    calls = []
+    stack = [args]
+    # Point every proxy at the shared call log
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, _Proxy):
+            obj._calls = calls
+        elif type(obj) is list:
+            stack.extend(obj)
+        elif type(obj) is dict:
+            stack.extend(obj.values())
+    if name is None:
+        handler(*args)
+    else:
+        getattr(handler, name)(*args)
+    return calls
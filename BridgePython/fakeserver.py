@@ -0,0 +1,212 @@
+import sys
+import struct
+import random
+import string
+import asyncio
+import logging
+import itertools
+
+from BridgePython import tcp, codec, compress
+from BridgePython.reference import RefDict
+
+'''
+@package fakeserver
+A small stand-in for the Bridge server, for tests and benchmarks.
+
+It speaks the length-prefixed JSON protocol and implements CONNECT,
+SEND, JOINWORKERPOOL, LEAVEWORKERPOOL, JOINCHANNEL, LEAVECHANNEL and
+GETCHANNEL for clients on one asyncio loop, in JSON or in any binary
+encoding and frame compression a client proposes and the server allows. Run it standalone with
+python -m BridgePython.fakeserver [port].
+'''
+
+
+def _mark_refs(obj):
+    # Keep refs from JSON clients tagged as refs when forwarded in a binary encoding
+    return RefDict(obj) if 'ref' in obj else obj
+
+
+def _guid():
+    return ''.join(random.choice(string.ascii_letters) for k in range(32))
+
+
+class FakeServer(object):
+    def __init__(self, host='127.0.0.1', port=0, encodings=None, compression=True,
+            compress_threshold=16384):
+        self.host = host
+        self.port = port
+        if encodings is None:
+            encodings = list(codec.binary_codecs)
+        self.encodings = codec.available_encodings(encodings)
+        self.compressions = compress.available_compressors(compression)
+        self.compress_threshold = compress_threshold
+        self.server = None
+        # client id -> _Client, for connected clients
+        self.clients = {}
+        # client id -> secret, for every session ever opened
+        self.secrets = {}
+        # service name -> client ids
+        self.workers = {}
+        # channel name -> client id -> handler ref
+        self.channels = {}
+        self.turn = itertools.count()
+        self.stats = {'connects': 0, 'resumes': 0, 'messages': 0, 'forwarded': 0}
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        self.server = await loop.create_server(lambda: _Client(self), self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    def close(self):
+        self.drop_all()
+        if self.server is not None:
+            self.server.close()
+
+    def drop_all(self):
+        '''Closes every client connection, keeping their sessions.'''
+        for client in list(self.clients.values()):
+            client.transport.close()
+
+    def handle(self, client, message):
+        self.stats['messages'] += 1
+        command, data = message['command'], message['data']
+        handler = getattr(self, 'on_' + command.lower(), None)
+        if handler is None:
+            logging.warning('Fake server ignoring %s', command)
+        else:
+            handler(client, data)
+
+    def on_connect(self, client, data):
+        session = data.get('session') or [None, None]
+        if session[0] in self.secrets and self.secrets[session[0]] == session[1]:
+            self.stats['resumes'] += 1
+            client.id, secret = session
+        else:
+            client.id, secret = _guid(), _guid()
+            self.secrets[client.id] = secret
+        self.stats['connects'] += 1
+        self.clients[client.id] = client
+        reply = [client.id, secret]
+        encoding = [name for name in data.get('encodings', []) if name in self.encodings]
+        compression = [name for name in data.get('compression', []) if name in self.compressions]
+        if encoding or compression:
+            reply.append(encoding[0] if encoding else 'json')
+        if compression:
+            reply.append(compression[0])
+        client.send_raw('|'.join(reply).encode('utf-8'))
+        if encoding:
+            client.codec = codec.get_codec(encoding[0])
+        if compression:
+            client.compressor = compress.get_compressor(compression[0])
+
+    def on_joinworkerpool(self, client, data):
+        workers = self.workers.setdefault(data['name'], [])
+        if client.id not in workers:
+            workers.append(client.id)
+        self.reply(client, data.get('callback'), [data['name']])
+
+    def on_leaveworkerpool(self, client, data):
+        workers = self.workers.get(data['name'], [])
+        if client.id in workers:
+            workers.remove(client.id)
+        self.reply(client, data.get('callback'), [data['name']])
+
+    def on_joinchannel(self, client, data):
+        name = data['name']
+        self.channels.setdefault(name, {})[client.id] = data['handler']
+        # Let the client store its handler and learn the channel reference
+        args = [name, data['handler']]
+        if data.get('callback'):
+            args.append(data['callback'])
+        client.send({
+            'destination': {'ref': ['client', client.id, 'system', 'hookChannelHandler']},
+            'args': args,
+        })
+
+    def on_leavechannel(self, client, data):
+        self.channels.get(data['name'], {}).pop(client.id, None)
+        self.reply(client, data.get('callback'), [data['name']])
+
+    def on_getchannel(self, client, data):
+        pass
+
+    def on_send(self, client, data):
+        address = data['destination']['ref']
+        message = {'destination': data['destination'], 'args': data['args'], 'source': client.id}
+        if address[0] == 'named':
+            workers = [id for id in self.workers.get(address[1], []) if id in self.clients]
+            if not workers:
+                return self.error(client, 'No workers for service %s' % address[1])
+            targets = [workers[next(self.turn) % len(workers)]]
+        elif address[0] == 'client':
+            targets = [address[1]]
+        elif address[0] == 'channel':
+            targets = list(self.channels.get(address[1], {}))
+        else:
+            return self.error(client, 'Unknown address %s' % address)
+        for id in targets:
+            target = self.clients.get(id)
+            if target is not None:
+                self.stats['forwarded'] += 1
+                target.send(message)
+
+    def reply(self, client, callback, args):
+        if callback:
+            client.send({'destination': {'ref': callback['ref'] + ['callback']}, 'args': args})
+
+    def error(self, client, msg):
+        client.send({
+            'destination': {'ref': ['client', client.id, 'system', 'remoteError']},
+            'args': [msg],
+        })
+
+
+class _Client(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.id = None
+        self.decoder = tcp.FrameDecoder()
+        self.codec = codec.JsonCodec()
+        self.compressor = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        for frame in self.decoder.feed(data):
+            try:
+                if type(frame) is compress.CompressedFrame:
+                    frame = self.compressor.decompress(frame)
+                message = self.codec.decode(frame, _mark_refs)
+            except Exception:
+                logging.error('Fake server could not parse %r', frame)
+                continue
+            self.server.handle(self, message)
+
+    def connection_lost(self, exc):
+        if self.server.clients.get(self.id) is self:
+            del self.server.clients[self.id]
+
+    def send(self, message):
+        self.send_raw(self.codec.encode(message))
+
+    def send_raw(self, data):
+        size = len(data)
+        if self.compressor is not None and size >= self.server.compress_threshold:
+            data = self.compressor.compress(data)
+            size = len(data) | compress.FLAG
+        self.transport.write(struct.pack('>I', size) + data)
+
+
+def main(port=8090):
+    async def run():
+        server = FakeServer('127.0.0.1', int(port))
+        print('Fake Bridge server on port %d' % await server.start())
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(*sys.argv[1:])
@@ -0,0 +1,272 @@
+import bisect
+import logging
+from datetime import timedelta
+
+'''
+Counters, gauges and histograms describing what the client is doing,
+and exporters for them.
+'''
+
+
+class Histogram(object):
+    '''Distribution of observed values in exponential buckets.
+
+    Default buckets suit durations in seconds, from half a millisecond to
+    a few minutes.
+    '''
+
+    default_bounds = [0.0005 * 2 ** i for i in range(20)]
+    # For sizes and counts rather than durations
+    count_bounds = [2 ** i for i in range(17)]
+
+    def __init__(self, bounds=None):
+        self.bounds = bounds or self.default_bounds
+        # One more bucket for values above the last bound
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        '''Upper bound of the bucket holding the p-th percentile.'''
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class Metrics(object):
+    '''Counters, gauges and histograms recorded by a Bridge.
+
+    Each metric is known by a name and a tuple of (label, value) pairs.
+    Collectors are called before metrics are read, so values that are
+    already tracked elsewhere cost nothing until then. Hooks are called
+    with (name, seconds, labels) for every timing recorded, for profiling.
+    '''
+
+    enabled = True
+    count_bounds = Histogram.count_bounds
+
+    def __init__(self, prefix='bridge'):
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+        self.hooks = []
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, labels=()):
+        self.gauges[(name, labels)] = value
+
+    def histogram(self, name, labels=(), bounds=None):
+        key = (name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(bounds)
+        return self.histograms[key]
+
+    def observe(self, name, value, labels=()):
+        self.histogram(name, labels).observe(value)
+
+    def timing(self, name, seconds, labels=()):
+        self.histogram(name, labels).observe(seconds)
+        for hook in self.hooks:
+            hook(name, seconds, labels)
+
+    def add_hook(self, func):
+        self.hooks.append(func)
+
+    def add_collector(self, func):
+        '''Registers func, called with this object before metrics are read.'''
+        self.collectors.append(func)
+
+    def collect(self):
+        for func in self.collectors:
+            func(self)
+
+    def snapshot(self):
+        '''Returns every metric as a dict keyed by name{label="value"}.'''
+        self.collect()
+        result = {}
+        for table in (self.counters, self.gauges):
+            for key, value in table.items():
+                result[_format_key(*key)] = value
+        for key, histogram in self.histograms.items():
+            result[_format_key(*key)] = histogram.snapshot()
+        return result
+
+
+class NullMetrics(object):
+    '''Stands in for Metrics when they are disabled.'''
+
+    enabled = False
+
+    def inc(self, name, value=1, labels=()):
+        pass
+
+    def set(self, name, value, labels=()):
+        pass
+
+    def observe(self, name, value, labels=()):
+        pass
+
+    def timing(self, name, seconds, labels=()):
+        pass
+
+    def add_hook(self, func):
+        pass
+
+    def add_collector(self, func):
+        pass
+
+    def collect(self):
+        pass
+
+    def snapshot(self):
+        return {}
+
+
+def get_metrics(spec):
+    '''Returns the metrics object for the metrics option of a Bridge.'''
+    if not spec:
+        return NullMetrics()
+    if spec is True:
+        return Metrics()
+    return spec
+
+
+def _format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in labels)
+
+
+def _format_key(name, labels):
+    return name + _format_labels(labels)
+
+
+def prometheus(metrics):
+    '''Renders metrics in the Prometheus text exposition format.'''
+    if not metrics.enabled:
+        return ''
+    metrics.collect()
+    lines = []
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE %s %s' % (name, kind))
+    typed = set()
+    for (name, labels), value in sorted(metrics.counters.items()):
+        name = '%s_%s_total' % (metrics.prefix, name)
+        header(name, 'counter')
+        lines.append('%s%s %s' % (name, _format_labels(labels), value))
+    for (name, labels), value in sorted(metrics.gauges.items()):
+        name = '%s_%s' % (metrics.prefix, name)
+        header(name, 'gauge')
+        lines.append('%s%s %s' % (name, _format_labels(labels), value))
+    for (name, labels), histogram in sorted(metrics.histograms.items(), key=lambda item: item[0]):
+        name = '%s_%s' % (metrics.prefix, name)
+        header(name, 'histogram')
+        seen = 0
+        for bound, count in zip(histogram.bounds, histogram.buckets):
+            seen += count
+            lines.append('%s_bucket%s %d' % (name, _format_labels(labels, [('le', repr(bound))]), seen))
+        lines.append('%s_bucket%s %d' % (name, _format_labels(labels, [('le', '+Inf')]), histogram.count))
+        lines.append('%s_sum%s %s' % (name, _format_labels(labels), histogram.sum))
+        lines.append('%s_count%s %d' % (name, _format_labels(labels), histogram.count))
+    return '\n'.join(lines) + '\n'
+
+
+class StatsdExporter(object):
+    '''Pushes metrics to a StatsD daemon over UDP.
+
+    Counters are sent as the change since the previous flush, gauges as
+    they are, and histograms as count, mean and percentile gauges. Labels
+    are folded into the metric name.
+    '''
+
+    def __init__(self, metrics, host='127.0.0.1', port=8125, max_packet=1400):
+        import socket
+        self.metrics = metrics
+        self.address = (host, port)
+        self.max_packet = max_packet
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sent = {}
+
+    def lines(self):
+        metrics = self.metrics
+        metrics.collect()
+        name = lambda key: '.'.join([metrics.prefix, key[0]] +
+            ['%s_%s' % (label, str(value).replace('.', '_')) for label, value in key[1]])
+        for key, value in list(metrics.counters.items()):
+            delta = value - self.sent.get(key, 0)
+            self.sent[key] = value
+            if delta:
+                yield '%s:%s|c' % (name(key), delta)
+        for key, value in list(metrics.gauges.items()):
+            yield '%s:%s|g' % (name(key), value)
+        for key, histogram in list(metrics.histograms.items()):
+            if not histogram.count:
+                continue
+            yield '%s.count:%d|g' % (name(key), histogram.count)
+            yield '%s.mean:%s|g' % (name(key), histogram.sum / histogram.count)
+            for p in (50, 90, 99):
+                yield '%s.p%d:%s|g' % (name(key), p, histogram.percentile(p))
+
+    def flush(self):
+        if not self.metrics.enabled:
+            return
+        packet = []
+        size = 0
+        for line in self.lines():
+            if packet and size + len(line) + 1 > self.max_packet:
+                self.send('\n'.join(packet))
+                packet, size = [], 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self.send('\n'.join(packet))
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data.encode('utf-8'), self.address)
+        except (IOError, OSError) as e:
+            logging.warning('Unable to send metrics to StatsD: %s', e)
+
+    def start(self, loop, interval=10):
+        '''Flushes every interval seconds on loop, a Bridge IOLoop.'''
+        def tick():
+            self.flush()
+            loop.add_timeout(timedelta(seconds=interval), tick)
+        loop.add_timeout(timedelta(seconds=interval), tick)
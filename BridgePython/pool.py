@@ -0,0 +1,301 @@
+import logging
+import itertools
+
+from BridgePython.bridge import Bridge
+from BridgePython.reference import RefDict
+
+'''
+@package pool
+Several Bridge sessions sharing one event loop.
+'''
+
+
+class BridgePool(object):
+    '''A set of Bridge sessions used as one.
+
+    Calls on references fetched from the pool go out over one session at a
+    time, chosen round robin or by fewest requests in flight. Services and
+    channel handlers are registered with every session.
+    '''
+
+    def __init__(self, sessions=2, endpoints=None, strategy='round_robin', **kwargs):
+        '''Create the sessions.
+
+        @param sessions: Number of sessions to open.
+        @param endpoints: List of (host, port) pairs sessions are spread
+        over. Defaults to the host and port keywords, or the redirector.
+        @param strategy: 'round_robin' or 'least_inflight'.
+        @param kwargs: Options passed to each Bridge.
+        '''
+        if strategy not in ('round_robin', 'least_inflight'):
+            raise ValueError('Unknown strategy: %s' % strategy)
+        self.strategy = strategy
+        self.sessions = []
+        for i in range(sessions):
+            options = dict(kwargs)
+            if endpoints:
+                options['host'], options['port'] = endpoints[i % len(endpoints)]
+            self.sessions.append(_Session(self, i, Bridge(**options)))
+        self._turn = itertools.count()
+        self._ready_callbacks = []
+
+    def connect(self, callback=None):
+        '''Connect every session and run the event loop.
+
+        @param callback: Called (with no arguments) once the first session is
+        ready.
+        @return: With the asyncio backend, a future resolved with this pool
+        once a session is ready.
+        '''
+        first = self.sessions[0].bridge
+        future = None
+        if first._options['loop'] is not None:
+            future = first._connection.create_future()
+        def onready():
+            if callback:
+                callback()
+            if future is not None and not future.done():
+                future.set_result(self)
+        self._ready_callbacks = [onready]
+        for session in self.sessions:
+            session.bridge._connection.open()
+        if future is not None:
+            return future
+        first._connection.loop.start()
+
+    def close(self):
+        '''Close every session once its queued messages are written.'''
+        for session in self.sessions:
+            session.drain()
+
+    def get_service(self, name):
+        '''Fetch a service from Bridge.
+
+        @param name: The service name.
+        @return: A reference whose calls are spread over the sessions.
+        '''
+        return PoolReference(self, lambda bridge: bridge.get_service(name))
+
+    def get_channel(self, name):
+        '''Fetch a channel from Bridge.
+
+        @param name: The name of the channel.
+        @return: A reference whose calls are spread over the sessions.
+        '''
+        return PoolReference(self, lambda bridge: bridge.get_channel(name))
+
+    def publish_service(self, name, handler, callback=None, executor=None):
+        '''Publish a service on every session.
+
+        @param name: The name of the service.
+        @param handler: Any instance.
+        @param callback: Called (with name of service as argument) once the
+        first session has published it.
+        @param executor: Where handler methods run, as for
+        Bridge.publish_service.
+        '''
+        callback = _first_only(callback)
+        for session in self.sessions:
+            session.bridge.publish_service(name, handler, callback, executor)
+
+    def join_channel(self, name, handler, writeable=True, callback=None, executor=None):
+        '''Join a channel on every session.
+
+        Each session receives its own copy of channel messages.
+
+        @param name: The name of the channel.
+        @param handler: Any instance.
+        @param writeable: Whether the handler's owner may write to the channel.
+        @param callback: Called (with reference to channel, and name of
+        channel) once the first session has joined.
+        @param executor: Where handler methods run, as for
+        Bridge.join_channel.
+        '''
+        callback = _first_only(callback)
+        for session in self.sessions:
+            session.bridge.join_channel(name, handler, writeable, callback, executor)
+
+    def request(self, method, *args, **kwargs):
+        '''Call a remote method over one session and get a future for its
+        reply, as for Bridge.request.
+
+        @param method: A method of a reference fetched from the pool.
+        '''
+        ref = method._reference
+        session = self.choose()
+        return session.bridge.request(getattr(ref._for(session), method._op),
+                *_resolve(args, session), **kwargs)
+
+    def health(self):
+        '''Describe each session.
+
+        @return: A list of dicts with the index, state, host, port,
+        client_id, inflight requests, queued messages, frames sent and
+        disconnects of each session.
+        '''
+        return [session.health() for session in self.sessions]
+
+    def choose(self):
+        # Prefer connected sessions, else any that may still connect
+        candidates = [s for s in self.sessions if s.state == 'ready']
+        if not candidates:
+            candidates = [s for s in self.sessions if s.state in ('connecting', 'disconnected')]
+        if not candidates:
+            raise RuntimeError('No usable Bridge sessions')
+        turn = next(self._turn)
+        if self.strategy == 'least_inflight':
+            low = min(s.inflight() for s in candidates)
+            candidates = [s for s in candidates if s.inflight() == low]
+        return candidates[turn % len(candidates)]
+
+    def _ready(self):
+        callbacks, self._ready_callbacks = self._ready_callbacks, []
+        for func in callbacks:
+            func()
+
+
+class PoolReference(object):
+    '''A reference resolved against whichever session a call goes out on.'''
+
+    def __init__(self, pool, factory):
+        self._pool = pool
+        self._factory = factory
+        # Session index -> reference on that session
+        self._refs = {}
+
+    def _for(self, session):
+        if session.index not in self._refs:
+            self._refs[session.index] = self._factory(session.bridge)
+        return self._refs[session.index]
+
+    def __getattr__(self, op):
+        if op.startswith('_'):
+            raise AttributeError(op)
+        def func(*args):
+            session = self._pool.choose()
+            return getattr(self._for(session), op)(*_resolve(args, session))
+        func._reference = self
+        func._op = op
+        return func
+
+
+class _Session(object):
+    def __init__(self, pool, index, bridge):
+        self.pool = pool
+        self.index = index
+        self.bridge = bridge
+        self.state = 'connecting'
+        self.disconnects = 0
+        bridge.on('ready', self.onready)
+        bridge.on('reconnect', self.onready)
+        bridge.on('disconnect', self.ondisconnect)
+        bridge.on('reconnect_failed', self.onfailed)
+
+    def onready(self):
+        if self.state in ('draining', 'closed'):
+            return
+        self.state = 'ready'
+        self.pool._ready()
+
+    def ondisconnect(self):
+        if self.state in ('draining', 'closed'):
+            self.state = 'closed'
+            return
+        self.disconnects += 1
+        self.state = 'disconnected'
+
+    def onfailed(self):
+        self.state = 'failed'
+        buffer = self.bridge._connection.sock_buffer.buffer
+        logging.error('Session %d failed with %d queued messages', self.index, len(buffer))
+        while buffer:
+            command, data = buffer.popleft()
+            if command != 'SEND':
+                # Registrations were made on every session
+                continue
+            try:
+                session = self.pool.choose()
+            except RuntimeError:
+                session = None
+            if session is None:
+                self.bridge.emit('dropped', {'command': command, 'data': data})
+            else:
+                session.adopt(self.bridge, data)
+
+    def adopt(self, other, data):
+        # Send a message queued on a failed session from this one instead
+        destination = data['destination']['ref']
+        if destination[0] == 'channel':
+            self.bridge.get_channel(destination[1])
+        self.bridge._connection.send_command('SEND', {
+            'args': _move_refs(other, self.bridge, data['args']),
+            'destination': data['destination'],
+        })
+
+    def drain(self):
+        # No new calls are routed here; queued ones go out before closing
+        connection = self.bridge._connection
+        self.state = 'closed' if connection.sock is connection.sock_buffer else 'draining'
+        connection.close()
+
+    def inflight(self):
+        return self.bridge._requests.inflight
+
+    def health(self):
+        connection = self.bridge._connection
+        return {
+            'index': self.index,
+            'state': self.state,
+            'host': self.bridge._options['host'],
+            'port': self.bridge._options['port'],
+            'client_id': connection.client_id,
+            'inflight': self.inflight(),
+            'queued': len(connection.sock_buffer.buffer),
+            'sent': connection.send_stats['frames'],
+            'disconnects': self.disconnects,
+        }
+
+
+def _resolve(args, session):
+    # Pool references in arguments are sent as the session's own
+    def resolve(obj):
+        if isinstance(obj, PoolReference):
+            return obj._for(session)
+        if isinstance(getattr(obj, '_reference', None), PoolReference):
+            return getattr(obj._reference._for(session), obj._op)
+        if type(obj) in (list, tuple):
+            return [resolve(val) for val in obj]
+        if type(obj) is dict:
+            return dict((key, resolve(val)) for key, val in obj.items())
+        return obj
+    return [resolve(val) for val in args]
+
+
+def _move_refs(source, target, obj):
+    # Store objects referenced from a message in target instead of source
+    if type(obj) is RefDict:
+        address = obj['ref']
+        if address[0] != 'client' or address[1] != source._connection.client_id:
+            return obj
+        stored = source._store.get(address[2])
+        if stored is None:
+            return obj
+        source._store.release(address[2])
+        return target._store_object(stored, obj.get('operations', []),
+                getattr(stored, 'once', False))._to_dict()
+    if type(obj) is list:
+        return [_move_refs(source, target, val) for val in obj]
+    if type(obj) is dict:
+        return dict((key, _move_refs(source, target, val)) for key, val in obj.items())
+    return obj
+
+
+def _first_only(callback):
+    if callback is None:
+        return None
+    called = []
+    def func(*args):
+        if not called:
+            called.append(True)
+            callback(*args)
+    return func
@@ -1,32 +1,58 @@
-import logging
+class RefDict(dict):
+    '''A serialized reference, told apart from plain dicts by binary codecs.'''
 
 
 class Reference(object):
+    __slots__ = ('_address', '_operations', '_bridge', '_methods', '_dicts', '__weakref__')
+
     def __init__(self, bridge, address, operations=[]):
         self._address = address
         # Store operations supported by this reference if any
         self._operations = operations
         self._bridge = bridge
+        # Method proxies and serialized forms by operation, made on first use
+        self._methods = {}
+        self._dicts = {}
 
     def _to_dict(self, op=None):
-        # Serialize the reference
-        val = {}
-        address = self._address
-        # Add a method name to address if given
-        if op:
-            address = self._address + [op]
-        val['ref'] = address
-        # Append operations only if address refers to a handler
-        if len(address) != 4:
-            val['operations'] = self._operations
+        # Serialize the reference, once per operation. The RefDict is shared
+        # by every message sent to this address, including those handed to
+        # 'dropped' listeners, so it must not be mutated.
+        val = self._dicts.get(op)
+        if val is None:
+            val = self._dicts[op] = RefDict()
+            address = self._address
+            # Add a method name to address if given
+            if op:
+                address = self._address + [op]
+            val['ref'] = address
+            # Append operations only if address refers to a handler
+            if len(address) != 4:
+                val['operations'] = self._operations
         return val
 
+    def _bind(self, client_id):
+        # Fill in the client id of a reference made before the handshake
+        self._address[1] = client_id
+        self._dicts.clear()
+
     def __getattr__(self, op):
-        # Create lambda that executes RPC call with requested pathchain
-        func = lambda *args: self._call(op, args)
-        func._reference = self
+        if op in Reference.__slots__:
+            # Only reached for slots not set yet
+            raise AttributeError(op)
+        func = self._methods.get(op)
+        if func is None:
+            # Create lambda that executes RPC call with requested pathchain
+            func = self._methods[op] = lambda *args: self._call(op, args)
+            func._reference = self
+            func._op = op
         return func
 
+    def _release(self):
+        # Drop the stored object this reference points to, if it is ours
+        return self._bridge.release(self)
+
     def _call(self, op, args):
-        logging.info('Calling %s.%s', self._address, op)
+        if self._bridge._trace is not None:
+            self._bridge._trace.call(self._address, op)
         self._bridge._send(args, self._to_dict(op))
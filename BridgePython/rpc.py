@@ -0,0 +1,137 @@
+import time
+import logging
+from datetime import timedelta
+
+from BridgePython import serializer, metrics
+
+'''
+Request/response calls: a remote method is called with a one-shot reply
+callback appended, and a future resolves with whatever it is called with.
+'''
+
+
+class RequestTimeout(Exception):
+    '''Raised through a request future when no reply came in time.'''
+
+
+class TooManyRequests(Exception):
+    '''Raised through a request future when max_inflight is reached.'''
+
+
+class RequestFailed(Exception):
+    '''Raised through a request future when its message was dropped or the
+    connection closed for good.'''
+
+
+class Requests(object):
+    '''Tracks requests in flight and their latency per service and method.'''
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+        self.inflight = 0
+        # (service, method) -> Histogram of reply latency in seconds
+        self.latency = {}
+        # id of the reply callback -> fails its request
+        self.waiting = {}
+        bridge.on('dropped', self.ondropped)
+        bridge.on('disconnect', self.ondisconnect)
+        bridge.on('reconnect_failed', lambda: self.fail_all('Reconnecting failed'))
+
+    def ondropped(self, message):
+        if message['command'] != 'SEND':
+            return
+        args = message['data']['args']
+        # The reply callback is the last argument of a request
+        if args and isinstance(args[-1], dict) and 'ref' in args[-1]:
+            callback = self.bridge._store.get(args[-1]['ref'][2])
+            fail = self.waiting.get(id(callback))
+            if fail is not None:
+                fail(RequestFailed('Request message was dropped'))
+
+    def ondisconnect(self):
+        if not self.bridge._options['reconnect']:
+            self.fail_all('Connection closed')
+
+    def fail_all(self, reason):
+        for fail in list(self.waiting.values()):
+            fail(RequestFailed(reason))
+
+    def request(self, ref, op, args, timeout=None):
+        options = self.bridge._options
+        connection = self.bridge._connection
+        future = connection.create_future()
+        if options['max_inflight'] is not None and self.inflight >= options['max_inflight']:
+            future.set_exception(TooManyRequests('%d requests in flight' % self.inflight))
+            return future
+        if timeout is None:
+            timeout = options['request_timeout']
+        address = ref._address
+        # Client ids are per caller, key those by service name instead
+        key = (address[2] if address[0] == 'client' else address[1], op)
+        start = time.time()
+        state = {}
+
+        def finish():
+            self.inflight -= 1
+            self.waiting.pop(id(callback), None)
+            if 'timeout' in state:
+                connection.loop.remove_timeout(state['timeout'])
+            if key not in self.latency:
+                self.latency[key] = metrics.Histogram()
+            self.latency[key].observe(time.time() - start)
+
+        def reply(*result):
+            if future.done():
+                return
+            finish()
+            future.set_result(result[0] if len(result) == 1 else result)
+
+        callback = serializer.Callback(reply, once=True)
+
+        def release():
+            stored = self.bridge._store.reference(callback)
+            if stored is not None:
+                self.bridge.release(stored)
+
+        def expire():
+            if future.done():
+                return
+            del state['timeout']
+            finish()
+            # Nobody will call the reply callback in time, drop it
+            release()
+            logging.warning('Request %s.%s timed out', key[0], op)
+            future.set_exception(RequestTimeout('%s.%s timed out after %ss' % (key[0], op, timeout)))
+
+        def fail(error):
+            if future.done():
+                return
+            finish()
+            release()
+            logging.warning('Request %s.%s failed: %s', key[0], op, error)
+            future.set_exception(error)
+
+        def arm():
+            # Timeouts are only set on the loop thread
+            if not future.done() and 'failed' not in state:
+                state['timeout'] = connection.loop.add_timeout(timedelta(seconds=timeout), expire)
+
+        self.inflight += 1
+        self.waiting[id(callback)] = fail
+        if timeout:
+            if connection.on_loop_thread():
+                arm()
+            else:
+                connection.loop.add_callback(arm)
+        try:
+            ref._call(op, tuple(args) + (callback,))
+        except Exception:
+            # Not sent, so no reply is coming
+            self.inflight -= 1
+            self.waiting.pop(id(callback), None)
+            state['failed'] = True
+            if 'timeout' in state:
+                connection.loop.remove_timeout(state.pop('timeout'))
+            release()
+            raise
+        return future
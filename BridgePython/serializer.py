@@ -4,38 +4,40 @@ import string
 import logging
 import traceback
 
-from BridgePython import reference, util
+from BridgePython import reference, util, stream
 
 
 
 class Callback(object):
-    def __init__(self, func):
+    def __init__(self, func, once=False):
         # We need a wrapper object to avoid binding func as a method.
         self.wrap = (func,)
+        # One-shot callbacks are dropped from the store after their first call
+        self.once = once
   
     def callback(self, *args):
         # Callback method so callbacks make sense to statically typed languages
         cb = self.wrap[0]
         return cb(*args)
 
-def serialize(bridge, obj):
-    # Enumerate array and serialize each member
-    if type(obj) == list:
-        return [serialize(bridge, elt) for elt in obj]
-    # Enumerate hash and serialize each member
-    elif type(obj) == dict:
-        return {key: serialize(bridge, val) for key, val in obj.items()}
-    else:
-        return serialize_atom(bridge, obj)
+    def __call__(self, *args):
+        return self.callback(*args)
 
+def serialize(bridge, obj, once=False):
+    # Dispatch on the exact type, anything unknown is an atom
+    return _serializers.get(type(obj), serialize_atom)(bridge, obj, once)
 
-def serialize_atom(bridge, atom):
+
+def serialize_atom(bridge, atom, once=False):
+    # Store wrapped callbacks as is
+    if isinstance(atom, Callback):
+        return bridge._store_object(atom, ['callback'], atom.once or once)._to_dict()
     # Store as callback if callable
-    if callable(atom):
+    elif callable(atom):
         if getattr(atom, '_reference', None) is not None:
             return atom._reference._to_dict()
         else:
-            return bridge._store_object(Callback(atom), ['callback'])._to_dict()
+            return bridge._store_object(Callback(atom, once), ['callback'], once)._to_dict()
     # Call to_dict if reference
     elif isinstance(atom, reference.Reference):
         return atom._to_dict()
@@ -45,24 +47,96 @@ def serialize_atom(bridge, atom):
     else:
         return atom
 
+
+def _serialize_list(bridge, obj, once):
+    # Enumerate array and serialize each member
+    get = _serializers.get
+    return [get(type(elt), serialize_atom)(bridge, elt, once) for elt in obj]
+
+
+def _serialize_dict(bridge, obj, once):
+    # Enumerate hash and serialize each member
+    get = _serializers.get
+    return {key: get(type(val), serialize_atom)(bridge, val, once) for key, val in obj.items()}
+
+
+def _serialize_primitive(bridge, obj, once):
+    return obj
+
+
+def _serialize_reference(bridge, obj, once):
+    return obj._to_dict()
+
+
+def _serialize_callback(bridge, obj, once):
+    return bridge._store_object(obj, ['callback'], obj.once or once)._to_dict()
+
+
+def _serialize_stream(bridge, obj, once):
+    ref = bridge._store_object(obj, stream.OPERATIONS)
+    # The stream releases itself once sent
+    obj.sent(bridge, ref)
+    return ref._to_dict()
+
+
+_serializers = {
+    list: _serialize_list,
+    tuple: _serialize_list,
+    dict: _serialize_dict,
+    reference.Reference: _serialize_reference,
+    Callback: _serialize_callback,
+    stream.Stream: _serialize_stream,
+}
+for primitive in util.primitives - set((tuple, list, dict)):
+    _serializers[primitive] = _serialize_primitive
+
+# Serialized references are dicts or, from binary codecs, RefDicts
+_maps = (dict, reference.RefDict)
+
 def unserialize(bridge, obj):
-    # If object has ref key, convert to reference
-    for container, key, ref in util.deep_scan(obj, util.ref_matcher):
-        address = ref['ref']
-        ops = ref.get('operations', [])
-        if address[1] == bridge._connection.client_id and address[0] == 'client':
-            container[key] = bridge._store[address[2]]
-            if hasattr(container[key], 'callback'):
-                container[key] = container[key].wrap[0]
-        else:           
-            # Create reference
-            ref = reference.Reference(bridge, address, ops)
-            if ref._operations == ['callback']:
-                obj = ref.callback
-                obj.callback = ref.callback
-                container[key] = obj
-            else:
-                container[key] = ref
+    # Walk containers with an explicit stack so deep nesting cannot overflow
+    if type(obj) not in (dict, list):
+        return obj
+    stack = [obj]
+    while stack:
+        container = stack.pop()
+        items = container.items() if type(container) is dict else enumerate(container)
+        for key, val in items:
+            if type(val) in _maps:
+                # If object has ref key, convert to reference
+                if util.is_ref(val):
+                    container[key] = resolve(bridge, val)
+                else:
+                    stack.append(val)
+            elif type(val) is list:
+                stack.append(val)
     return obj
 
 
+def ref_hook(bridge):
+    # Decoder object hook converting refs as they are parsed
+    def hook(obj):
+        if util.is_ref(obj):
+            return resolve(bridge, obj)
+        return obj
+    return hook
+
+
+def resolve(bridge, ref):
+    address = ref['ref']
+    if address[1] == bridge._connection.client_id and address[0] == 'client':
+        obj = bridge._store.get(address[2])
+        if obj is None:
+            logging.warning('Stored object %s was released or evicted', address[2])
+        elif isinstance(obj, Callback):
+            obj = obj.wrap[0]
+        return obj
+    # Create reference
+    ref = reference.Reference(bridge, address, ref.get('operations', []))
+    if ref._operations == ['callback']:
+        func = ref.callback
+        func.callback = ref.callback
+        return func
+    if stream.MARKER in ref._operations:
+        return stream.StreamReader(ref)
+    return ref
@@ -0,0 +1,151 @@
+import time
+import logging
+from collections import OrderedDict
+
+
+class _Entry(object):
+    __slots__ = ('obj', 'expiry', 'once', 'key', 'ref')
+
+    def __init__(self, obj, expiry, once, key, ref):
+        self.obj = obj
+        self.expiry = expiry
+        self.once = once
+        self.key = key
+        self.ref = ref
+
+
+class Store(object):
+    '''Objects reachable by the Bridge server.
+
+    Named entries (published services, channel handlers, the system
+    service) live until they are replaced. Anonymous entries created for
+    callbacks and handler objects passed through the serializer may be
+    one-shot, expire after a ttl, or be evicted once the store holds more
+    than limit of them.
+
+    Anonymous entries are kept in a plain dict unless a limit or ttl needs
+    them ordered by use, which keeps lookups cheap with millions of them.
+    '''
+
+    def __init__(self, limit=None, ttl=None):
+        self.limit = limit
+        self.ttl = ttl
+        self._named = {}
+        # name -> _Entry, least recently used first when ordered
+        self._ordered = limit is not None or bool(ttl)
+        self._anonymous = OrderedDict() if self._ordered else {}
+        # id of the stored object (or wrapped function) -> name
+        self._keys = {}
+        self.stats = {
+            'stored': 0,
+            'released': 0,
+            'consumed': 0,
+            'evicted': 0,
+            'expired': 0,
+        }
+
+    def __setitem__(self, name, obj):
+        self._named[name] = obj
+
+    def __getitem__(self, name):
+        if name in self._named:
+            return self._named[name]
+        entry = self._lookup(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry.obj
+
+    def __contains__(self, name):
+        return name in self._named or self._lookup(name) is not None
+
+    def __len__(self):
+        return len(self._named) + len(self._anonymous)
+
+    def is_named(self, name):
+        return name in self._named
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def add(self, name, obj, once=False, key=None, ref=None):
+        '''Stores obj under name.
+
+        key (defaulting to obj) maps back to ref so the same object is not
+        stored twice.
+        '''
+        if key is None:
+            key = obj
+        if not self._ordered:
+            self._anonymous[name] = _Entry(obj, None, once, key, ref)
+            self._keys[id(key)] = name
+            self.stats['stored'] += 1
+            return
+        now = time.time()
+        expiry = now + self.ttl if self.ttl else None
+        self._anonymous[name] = _Entry(obj, expiry, once, key, ref)
+        self._keys[id(key)] = name
+        self.stats['stored'] += 1
+        if self.ttl:
+            # Entries are kept in access order, so expired ones lead
+            while True:
+                oldest = next(iter(self._anonymous))
+                if self._anonymous[oldest].expiry > now:
+                    break
+                self._drop(oldest, 'expired')
+        if self.limit is not None:
+            while len(self._anonymous) > self.limit:
+                evicted = next(iter(self._anonymous))
+                self._drop(evicted, 'evicted')
+                logging.info('Evicted stored object %s', evicted)
+
+    def reference(self, key):
+        '''Returns the reference of a live entry stored for key, if any.'''
+        name = self._keys.get(id(key))
+        if name is None:
+            return None
+        entry = self._lookup(name)
+        if entry is None:
+            return None
+        return entry.ref
+
+    def consume(self, name):
+        '''Drops name if it was stored as a one-shot entry.'''
+        entry = self._anonymous.get(name)
+        if entry is not None and entry.once:
+            self._drop(name, 'consumed')
+
+    def release(self, name):
+        '''Drops an anonymous entry. Returns True if it was present.'''
+        if name not in self._anonymous:
+            return False
+        self._drop(name, 'released')
+        return True
+
+    def expire(self):
+        '''Drops every anonymous entry whose ttl has passed.'''
+        now = time.time()
+        for name in [name for name, entry in self._anonymous.items()
+                if entry.expiry is not None and entry.expiry <= now]:
+            self._drop(name, 'expired')
+
+    def _drop(self, name, reason):
+        entry = self._anonymous.pop(name)
+        if self._keys.get(id(entry.key)) == name:
+            del self._keys[id(entry.key)]
+        self.stats[reason] += 1
+
+    def _lookup(self, name):
+        entry = self._anonymous.get(name)
+        if entry is None or not self._ordered:
+            return entry
+        if entry.expiry is not None and entry.expiry <= time.time():
+            self._drop(name, 'expired')
+            return None
+        # Mark as most recently used
+        self._anonymous.move_to_end(name)
+        if self.ttl:
+            entry.expiry = time.time() + self.ttl
+        return entry
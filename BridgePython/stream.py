@@ -0,0 +1,263 @@
+import base64
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+
+'''
+Streaming arguments. A Stream passed to a remote call is sent as a series
+of bounded chunks, pulled by the receiving side, which gets a StreamReader
+in its place. The reader asks for window chunks up front and for more as
+they are consumed, so neither side holds more than window chunks.
+'''
+
+# Operations a stream reference is serialized with. util.find_ops skips
+# names starting with an underscore, so MARKER never names a handler's.
+MARKER = '_stream'
+OPERATIONS = ['pull', 'cancel', MARKER]
+
+
+class StreamError(Exception):
+    '''Raised by a StreamReader when the sending side failed.'''
+
+
+class Stream(object):
+    '''Sends an iterable or file-like object in chunks.
+
+    source is read with read(chunk_size) if it has a read method, and
+    iterated otherwise; longer items are split. Chunks may be bytes or
+    text, bytes are sent as is once a binary encoding is negotiated. The
+    source is not closed once sent. A stream nobody pulls from within
+    timeout seconds is released.
+    '''
+
+    def __init__(self, source, chunk_size=65536, timeout=60):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        # Set when serialized
+        self.bridge = None
+        self.ref = None
+        self.timer = None
+        self.iterator = None
+        self.rest = None
+        self.closed = False
+
+    def sent(self, bridge, ref):
+        self.bridge, self.ref = bridge, ref
+        if self.timeout is not None:
+            self.timer = bridge._connection.loop.add_timeout(
+                timedelta(seconds=self.timeout), self.expire)
+
+    def expire(self):
+        self.timer = None
+        if not self.closed:
+            logging.warning('Stream was not read in %ss, releasing it', self.timeout)
+            self.cancel()
+
+    def pull(self, credit, sink):
+        # Called by the receiving side for up to credit more chunks
+        if self.timer is not None:
+            self.bridge._connection.loop.remove_timeout(self.timer)
+            self.timer = None
+        binary = self.bridge is not None and self.bridge._connection.binary
+        for i in range(credit):
+            if self.closed:
+                return
+            try:
+                data = self.next_chunk()
+            except Exception as e:
+                logging.error('Exception while reading stream: %s', e)
+                self.closed = True
+                sink.error(str(e))
+                return
+            if data is None:
+                self.closed = True
+                sink.end()
+                return
+            if isinstance(data, bytes):
+                if binary:
+                    sink.chunk(data, 'bytes')
+                else:
+                    sink.chunk(base64.b64encode(data).decode('ascii'), 'base64')
+            else:
+                sink.chunk(data, 'text')
+
+    def cancel(self):
+        # Also sent once the reader is done, after any pulls it sent
+        self.closed = True
+        if self.timer is not None:
+            self.bridge._connection.loop.remove_timeout(self.timer)
+            self.timer = None
+        if self.ref is not None:
+            self.bridge.release(self.ref)
+
+    def next_chunk(self):
+        size = self.chunk_size
+        if self.rest:
+            data, self.rest = self.rest[:size], self.rest[size:]
+            return data
+        if hasattr(self.source, 'read'):
+            return self.source.read(size) or None
+        if self.iterator is None:
+            self.iterator = iter(self.source)
+        for data in self.iterator:
+            if not data:
+                continue
+            if len(data) > size:
+                data, self.rest = data[:size], data[size:]
+            return data
+        return None
+
+
+class StreamReader(object):
+    '''The receiving end of a Stream.
+
+    Iterate it with async for on the loop, with for on another thread (a
+    'thread' executor, say), or pass callbacks to read().
+    '''
+
+    def __init__(self, ref, window=8):
+        self._ref = ref
+        self._bridge = ref._bridge
+        self.window = window
+        self._chunks = deque()
+        self._started = False
+        self._done = False
+        self._error = None
+        # Chunks consumed since credit was last granted
+        self._credit = 0
+        self._ready = threading.Condition()
+        self._waiter = None
+        self._callbacks = None
+        self._sink = _Sink(self)
+
+    def read(self, on_chunk, on_end=None, on_error=None):
+        '''Calls on_chunk with each chunk as it arrives, on the loop.
+
+        on_end is called with no arguments once the stream is done, and
+        on_error with a message if the sending side failed.
+        '''
+        self._callbacks = (on_chunk, on_end, on_error)
+        while self._chunks:
+            on_chunk(self._chunks.popleft())
+            self._consumed()
+        if self._done:
+            self._notify_end()
+        self._start()
+
+    def close(self):
+        '''Stops the stream; chunks still in flight are dropped.'''
+        connection = self._bridge._connection
+        if not connection.on_loop_thread():
+            # The store is only touched on the loop
+            connection.loop.add_callback(self.close)
+            return
+        self._finish(None)
+        self._chunks.clear()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._bridge._connection.loop_thread is threading.current_thread():
+            raise RuntimeError('Reading a stream would block the loop, use async for or read()')
+        self._start()
+        with self._ready:
+            while not self._chunks and not self._done:
+                self._ready.wait()
+            data = self._chunks.popleft() if self._chunks else None
+        if data is None:
+            if self._error is not None:
+                raise StreamError(self._error)
+            raise StopIteration
+        self._consumed()
+        return data
+
+    next = __next__
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self._start()
+        while not self._chunks and not self._done:
+            self._waiter = self._bridge._connection.create_future()
+            await self._waiter
+        if not self._chunks:
+            if self._error is not None:
+                raise StreamError(self._error)
+            raise StopAsyncIteration
+        data = self._chunks.popleft()
+        self._consumed()
+        return data
+
+    def _start(self):
+        if not self._started:
+            self._started = True
+            self._ref.pull(self.window, self._sink)
+
+    def _consumed(self):
+        # Grant credit back in batches of half the window
+        self._credit += 1
+        if self._credit >= max(1, self.window // 2) and not self._done:
+            self._ref.pull(self._credit, self._sink)
+            self._credit = 0
+
+    def _push(self, data):
+        if self._done:
+            return
+        if self._callbacks is not None:
+            self._callbacks[0](data)
+            self._consumed()
+            return
+        with self._ready:
+            self._chunks.append(data)
+            self._ready.notify()
+        self._wake()
+
+    def _finish(self, error):
+        if self._done:
+            return
+        self._done = True
+        self._error = error
+        # Lets the sending side drop the stream
+        self._ref.cancel()
+        stored = self._bridge._store.reference(self._sink)
+        if stored is not None:
+            self._bridge.release(stored)
+        with self._ready:
+            self._ready.notify_all()
+        self._wake()
+        if self._callbacks is not None:
+            self._notify_end()
+
+    def _notify_end(self):
+        on_chunk, on_end, on_error = self._callbacks
+        if self._error is not None:
+            if on_error:
+                on_error(self._error)
+        elif on_end:
+            on_end()
+
+    def _wake(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class _Sink(object):
+    # Stored for the sending side to deliver chunks to
+    def __init__(self, reader):
+        self._reader = reader
+
+    def chunk(self, data, kind):
+        if kind == 'base64':
+            data = base64.b64decode(data)
+        self._reader._push(data)
+
+    def end(self):
+        self._reader._finish(None)
+
+    def error(self, msg):
+        self._reader._finish(msg)
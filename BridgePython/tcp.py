@@ -2,16 +2,90 @@ import sys
 import struct
 import socket
 import ssl
+import logging
+from collections import deque
+from datetime import timedelta
 
 from tornado import iostream
-from tornado.escape import utf8, native_str
+from tornado.escape import utf8
 
-from BridgePython import data
+from BridgePython import data, compress
+from BridgePython.compress import CompressedFrame
 import os.path
 
+pack_header = struct.Struct('>I').pack
+unpack_header = struct.Struct('>I').unpack_from
+
+
+class FrameDecoder(object):
+    '''Splits a byte stream into length-prefixed frames.
+
+    Frames flagged as compressed come out as CompressedFrame.
+    '''
+
+    def __init__(self):
+        # Holds the tail of a frame split across reads
+        self.buffer = bytearray()
+        # Whether the last feed returned a compressed frame
+        self.flagged = False
+
+    def feed(self, data):
+        # Only copy into the buffer when a frame straddles reads
+        if self.buffer:
+            self.buffer += data
+            data = self.buffer
+        frames = []
+        self.flagged = False
+        view = memoryview(data)
+        offset, end = 0, len(data)
+        while end - offset >= 4:
+            size = unpack_header(data, offset)[0]
+            flagged = size & compress.FLAG
+            if flagged:
+                size &= compress.SIZE_MASK
+            if end - offset - 4 < size:
+                break
+            offset += 4
+            if flagged:
+                self.flagged = True
+                frames.append(CompressedFrame(view[offset:offset + size]))
+            else:
+                frames.append(view[offset:offset + size].tobytes())
+            offset += size
+        view.release()
+        if data is self.buffer:
+            del self.buffer[:offset]
+        elif offset < end:
+            self.buffer += data[offset:]
+        return frames
+
+
 class Tcp(object):
+    # Bytes requested from the stream per read
+    chunk_size = 65536
+
     def __init__(self, connection):
         self.connection = connection
+        self.decoder = FrameDecoder()
+        self.reading = False
+        self.paused = False
+        # Frames waiting for the next batched write
+        self.pending = []
+        self.pending_bytes = 0
+        self.flush_scheduled = False
+        # Compressor agreed at CONNECT, if any
+        self.compressor = None
+        # Frames queued behind ones being compressed or decompressed on a
+        # worker thread, to keep them in order
+        self.outbound = deque()
+        self.inbound = deque()
+        self.close_pending = False
+        # Bytes handed to the stream and not yet sent, when write_high is set
+        self.unsent = 0
+        self.connect()
+
+    def connect(self):
+        connection = self.connection
         # Start socket
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
         self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -26,30 +100,183 @@ class Tcp(object):
             # Create IOStream for TCP connection
             self.stream = iostream.IOStream(self.socket)
         server = (self.connection.options['host'], self.connection.options['port'])
-        self.stream.connect(server, self.onopen)
+        connection.loop.add_future(self.stream.connect(server), self.onopen)
         self.stream.set_close_callback(self.connection.onclose)
 
-    def onopen(self):
+    def onopen(self, future):
+        if future.exception():
+            return
         self.connection.onopen(self)
         self.wait()
     
     def wait(self):
-        # Read header bytes
-        self.stream.read_bytes(4, self.header_handler)
-
-    def header_handler(self, data):
-        size = struct.unpack('>I', data)[0]
-        # Read body bytes
-        self.stream.read_bytes(size, self.body_handler)
-
-    def body_handler(self, data):
-        # Call message handler
-        self.connection.onmessage({'data': native_str(data)}, self)
-        # Await next message
-        self.wait()
+        # Read whatever is available, up to chunk_size bytes
+        self.reading = True
+        future = self.stream.read_bytes(self.chunk_size, partial=True)
+        self.connection.loop.add_future(future, self.onread)
+
+    def onread(self, future):
+        self.reading = False
+        if future.exception():
+            return
+        self.receive_data(future.result())
+        # Await more data unless the connection asked us to hold off
+        if not self.paused:
+            self.wait()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        if not self.reading and not self.stream.closed():
+            self.wait()
+
+    def receive_data(self, data):
+        frames = self.decoder.feed(data)
+        if self.decoder.flagged or self.inbound:
+            self.inflate(frames)
+        elif frames:
+            # Call message handler with every complete frame
+            self.connection.onframes(frames, self)
+
+    def inflate(self, frames):
+        for frame in frames:
+            if type(frame) is not CompressedFrame:
+                self.inbound.append(frame)
+            elif self.compressor is None:
+                logging.error('Dropping compressed frame, no compression was agreed')
+            elif len(frame) >= self.connection.options['compress_offload']:
+                future = compress.offload(self.compressor.decompress, frame)
+                self.connection.loop.add_future(future, self.oninflated)
+                self.inbound.append(future)
+            else:
+                try:
+                    self.inbound.append(self.compressor.decompress(frame))
+                except Exception as e:
+                    logging.error('Unable to decompress frame: %s', e)
+        self.oninflated()
+
+    def oninflated(self, future=None):
+        # Hand over frames up to the first still being decompressed
+        frames = []
+        inbound = self.inbound
+        while inbound and (isinstance(inbound[0], bytes) or inbound[0].done()):
+            frame = inbound.popleft()
+            if not isinstance(frame, bytes):
+                if frame.exception() is not None:
+                    logging.error('Unable to decompress frame: %s', frame.exception())
+                    continue
+                frame = frame.result()
+            frames.append(frame)
+        if frames:
+            self.connection.onframes(frames, self)
 
     def send(self, arg):
         arg = utf8(arg)
-        # Prepend length header to message
-        self.stream.write(struct.pack('>I', len(arg)) + arg)
+        options = self.connection.options
+        if self.compressor is not None and len(arg) >= options['compress_threshold']:
+            if len(arg) >= options['compress_offload']:
+                future = compress.offload(self.deflate, arg)
+                self.connection.loop.add_future(future, self.ondeflated)
+                self.outbound.append(future)
+                return
+            frame = self.deflate(arg)
+        else:
+            frame = (pack_header(len(arg)), arg, False)
+        if self.outbound:
+            # Wait for frames ahead being compressed
+            self.outbound.append(frame)
+        else:
+            self.write_frame(*frame)
+
+    def deflate(self, arg):
+        # Keep the original if compressing does not pay
+        data = self.compressor.compress(arg)
+        if len(data) >= len(arg):
+            return pack_header(len(arg)), arg, False
+        return pack_header(len(data) | compress.FLAG), data, True
+
+    def ondeflated(self, future):
+        outbound = self.outbound
+        while outbound and (type(outbound[0]) is tuple or outbound[0].done()):
+            frame = outbound.popleft()
+            if type(frame) is not tuple:
+                if frame.exception() is not None:
+                    logging.error('Unable to compress frame: %s', frame.exception())
+                    continue
+                frame = frame.result()
+            self.write_frame(*frame)
+        if not outbound and self.close_pending:
+            self.close()
+
+    def write_frame(self, header, arg, compressed=False):
+        stats = self.connection.send_stats
+        if compressed:
+            stats['compressed'] += 1
+        stats['frames'] += 1
+        stats['bytes'] += len(arg) + 4
+        options = self.connection.options
+        if not options['batch']:
+            stats['writes'] += 1
+            self.write(header + arg)
+            return
+        self.pending.append(header)
+        self.pending.append(arg)
+        self.pending_bytes += len(arg) + 4
+        if self.pending_bytes >= options['batch_bytes']:
+            self.flush()
+        elif not self.flush_scheduled:
+            self.flush_scheduled = True
+            loop = self.connection.loop
+            if options['batch_latency']:
+                delta = timedelta(milliseconds=options['batch_latency'])
+                loop.add_timeout(delta, self.flush)
+            else:
+                # Flush once the current IOLoop iteration is done
+                loop.add_callback(self.flush)
+
+    def close(self):
+        if self.outbound:
+            # Close once frames being compressed are written
+            self.close_pending = True
+            return
+        self.flush()
+        if not self.stream.closed():
+            # Close once everything written so far has been flushed
+            self.connection.loop.add_future(self.stream.write(b''),
+                lambda future: self.stream.close())
+
+    def flush(self):
+        self.flush_scheduled = False
+        if not self.pending or self.stream.closed():
+            return
+        stats = self.connection.send_stats
+        stats['writes'] += 1
+        stats['flushes'] += 1
+        stats['batched_frames'] += len(self.pending) // 2
+        data = b''.join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        self.write(data)
+
+    def write(self, data):
+        future = self.stream.write(data)
+        high = self.connection.options['write_high']
+        if high is None:
+            return
+        self.unsent += len(data)
+        if self.unsent >= high and not self.connection.saturated:
+            self.connection.onsaturated()
+        self.connection.loop.add_future(future, lambda future: self.onwritten(future, len(data)))
+
+    def onwritten(self, future, size):
+        # Fails once the stream is closed, nothing more to track then
+        future.exception()
+        self.unsent -= size
+        if self.unsent <= self.connection.options['write_low'] and self.connection.saturated:
+            self.connection.ondrained()
+
+    def write_buffer_size(self):
+        return self.unsent
 
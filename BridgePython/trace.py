@@ -0,0 +1,56 @@
+import logging
+
+'''
+Wire trace: logs messages sent and received on the 'BridgePython.wire'
+logger, apart from the general log level. Off by default, in which case
+the hot paths skip it with a single None check.
+'''
+
+
+class WireTrace(object):
+    '''Logs a sample of wire messages, truncated.
+
+    One message in every sample is logged, at most limit bytes of it.
+    Nothing is formatted unless the logger is enabled for level.
+    '''
+
+    def __init__(self, sample=1, limit=512, level=logging.DEBUG, logger=None):
+        self.sample = max(1, int(sample))
+        self.limit = limit
+        self.level = level
+        self.logger = logger or logging.getLogger('BridgePython.wire')
+        if self.logger.level == logging.NOTSET:
+            self.logger.setLevel(level)
+        self.seen = 0
+
+    def received(self, data):
+        if self.logger.isEnabledFor(self.level) and self.sampled():
+            self.logger.log(self.level, 'Received %s', self.truncate(data))
+
+    def sent(self, data):
+        if self.logger.isEnabledFor(self.level) and self.sampled():
+            self.logger.log(self.level, 'Sending %s', self.truncate(data))
+
+    def call(self, address, op):
+        if self.logger.isEnabledFor(self.level) and self.sampled():
+            self.logger.log(self.level, 'Calling %s.%s', address, op)
+
+    def sampled(self):
+        self.seen += 1
+        return self.seen % self.sample == 0
+
+    def truncate(self, data):
+        if self.limit is None or len(data) <= self.limit:
+            return data
+        return '%r... (%d bytes)' % (data[:self.limit], len(data))
+
+
+def get_trace(spec):
+    '''Returns the wire trace for the trace option of a Bridge, or None.'''
+    if not spec:
+        return None
+    if spec is True:
+        return WireTrace()
+    if isinstance(spec, dict):
+        return WireTrace(**spec)
+    return spec
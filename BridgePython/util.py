@@ -1,15 +1,14 @@
+import os
 import types
-import random
-import string
 import logging
 import traceback
-import json
+from binascii import hexlify
 
-from tornado.escape import utf8, native_str
+from tornado.escape import utf8
 
-from BridgePython import reference
+from BridgePython import reference, codec
 
-primitives = set((int, str, bool, float, tuple, list, dict, type(None)))
+primitives = set((int, str, bytes, bool, float, tuple, list, dict, type(None)))
 try:
     primitives.update((long, types.UnicodeType))
 except NameError:
@@ -33,38 +32,59 @@ def set_log_level(level):
 
 
 def generate_guid():
-    return ''.join([
-        random.choice(string.ascii_letters) for k in range(32)
-    ])
+    # 128 random bits as 32 hex characters. Ids are used as capabilities,
+    # so unlike a counter they must not be guessable from one another.
+    return hexlify(os.urandom(16)).decode('ascii')
     
 
 def stringify(val):
-    return utf8(json.dumps(val, default=str))
+    return codec.default.encode(val)
 
 
 def parse(val):
-    return json.loads(native_str(val))
+    return codec.default.decode(utf8(val))
 
 
-def ref_matcher(key, val):
-    return type(val) == dict and 'ref' in val
+def is_ref(val):
+    # Four element addresses name a method and only appear as destinations
+    if not isinstance(val, dict):
+        return False
+    address = val.get('ref')
+    return type(address) is list and len(address) < 4
 
 
-def deep_scan(obj, matcher):
-    iterator = []
-    if type(obj) is dict:
-        iterator = obj.items()
-    elif type(obj) is list:
-        iterator = enumerate(obj)
-    for key, val in iterator:
-        if matcher(key, val):
-            yield obj, key, val
-        else:
-            for result in deep_scan(val, matcher):
-                yield result
+# Class -> public methods defined on the class
+ops_cache = {}
 
 
 def find_ops(obj):
-    return [fn for fn in dir(obj)
-                if not fn.startswith('_') and
-                    callable(getattr(obj, fn))]
+    cls = getattr(obj, '__class__', type(obj))
+    if isinstance(obj, type):
+        # Classes are handlers themselves, so look at their own methods
+        return [fn for fn in dir(obj)
+                    if not fn.startswith('_') and
+                        callable(getattr(obj, fn))]
+    ops = ops_cache.get(cls)
+    if ops is None:
+        ops = ops_cache[cls] = [fn for fn in dir(cls)
+                    if not fn.startswith('_') and
+                        callable(getattr(cls, fn))]
+    # Methods attached to the instance itself are not cached
+    attrs = getattr(obj, '__dict__', None)
+    if attrs:
+        extra = [fn for fn, val in attrs.items()
+                    if not fn.startswith('_') and callable(val)]
+        if extra:
+            return sorted(set(ops).union(extra))
+    return ops
+
+
+def invalidate_ops(cls=None):
+    '''Forget cached methods of cls, or of every class.
+
+    Needed after methods are added to or removed from a class at runtime.
+    '''
+    if cls is None:
+        ops_cache.clear()
+    else:
+        ops_cache.pop(cls, None)
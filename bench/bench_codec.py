@@ -0,0 +1,56 @@
+#!/usr/bin/python
+'''Compares the wire codecs on typical SEND messages.
+
+Usage: python bench/bench_codec.py [iterations]
+'''
+import sys
+import timeit
+
+from BridgePython import codec
+
+
+def send_message(args):
+    return {
+        'command': 'SEND',
+        'data': {
+            'args': args,
+            'destination': {'ref': ['named', 'chat', 'chat', 'message']},
+        },
+    }
+
+
+payloads = {
+    'small': send_message(['lobby', 'hello world', {
+        'ref': ['client', 'bUVSJqUSvUBKKtvYfRPzGcSWHJkmFKJi', 'vbKqWYbLmnPNQCWdNuJBhWaMMKaVxcUJ'],
+        'operations': ['callback'],
+    }]),
+    'records': send_message([[{
+        'id': i,
+        'name': 'user%d' % i,
+        'score': i * 1.5,
+        'active': i % 2 == 0,
+        'tags': ['a', 'b', 'c'],
+    } for i in range(100)]]),
+    'text': send_message(['x' * 16384]),
+}
+
+
+def main(iterations=10000):
+    available = []
+    for name in codec.preference:
+        try:
+            available.append(codec.get_codec(name))
+        except ImportError:
+            pass
+    print('%-10s %-10s %12s %12s' % ('payload', 'codec', 'encode us', 'decode us'))
+    for label, payload in sorted(payloads.items()):
+        for impl in available:
+            data = impl.encode(payload)
+            encode = timeit.timeit(lambda: impl.encode(payload), number=iterations)
+            decode = timeit.timeit(lambda: impl.decode(data), number=iterations)
+            print('%-10s %-10s %12.2f %12.2f' % (label, impl.name,
+                encode / iterations * 1e6, decode / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+'''Measures id allocation and the cost of each stored callback.
+
+Compares the old random.choice ids with util.generate_guid, then stores
+count callbacks through Bridge._store_object and reports time and traced
+memory per entry, with and without a store_limit.
+
+Usage: python bench/bench_store.py [count]
+'''
+import sys
+import time
+import timeit
+import random
+import string
+import tracemalloc
+
+from BridgePython import util
+from BridgePython.bridge import Bridge
+
+
+def choice_guid():
+    return ''.join([random.choice(string.ascii_letters) for k in range(32)])
+
+
+def bench_store(count, **options):
+    bridge = Bridge(host='localhost', port=8090, **options)
+    bridge._connection.client_id = 'bench'
+    funcs = [lambda: None for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for func in funcs:
+        bridge._store_object(func, ['callback'])
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    lookups = [bridge._store.reference(func)._address[2] for func in funcs[::97]]
+    start = time.perf_counter()
+    for name in lookups:
+        bridge._store.get(name)
+    lookup = (time.perf_counter() - start) / len(lookups)
+    return elapsed / count * 1e6, used / count, lookup * 1e6
+
+
+def main(count=200000):
+    print('%-24s %12s' % ('id', 'us/id'))
+    for label, func in [('random.choice', choice_guid), ('util.generate_guid', util.generate_guid)]:
+        seconds = timeit.timeit(func, number=100000)
+        print('%-24s %12.3f' % (label, seconds / 100000 * 1e6))
+    print('')
+    print('%-24s %12s %12s %12s' % ('store', 'us/store', 'bytes/entry', 'us/lookup'))
+    for label, options in [('unbounded', {}), ('store_limit', {'store_limit': count * 2})]:
+        print('%-24s %12.3f %12.1f %12.3f' % ((label,) + bench_store(count, **options)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
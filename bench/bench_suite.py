@@ -0,0 +1,186 @@
+#!/usr/bin/python
+'''Runs client benchmarks against the bundled fake Bridge server.
+
+Measures request round-trip latency, channel fan-out throughput,
+serialize/unserialize cost and how quickly a crowd of clients resumes
+after the server drops them. Results are printed and written as JSON.
+
+Usage: python bench/bench_suite.py [output.json] [scale]
+'''
+import sys
+import json
+import time
+import timeit
+import asyncio
+import logging
+import platform
+
+from BridgePython import serializer, codec
+from BridgePython.bridge import Bridge
+from BridgePython.fakeserver import FakeServer
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))]
+    return {
+        'count': len(samples),
+        'mean': sum(samples) / len(samples),
+        'p50': pick(50),
+        'p90': pick(90),
+        'p99': pick(99),
+        'max': samples[-1],
+    }
+
+
+def client(port, **kwargs):
+    return Bridge(host='127.0.0.1', port=port, loop='asyncio', **kwargs)
+
+
+class Echo(object):
+    def ping(self, value, callback):
+        callback(value)
+
+
+class Counter(object):
+    def __init__(self, expected, done):
+        self.seen = 0
+        self.expected = expected
+        self.done = done
+
+    def message(self, value):
+        self.seen += 1
+        if self.seen == self.expected:
+            self.done.set_result(None)
+
+
+async def bench_rpc(port, requests):
+    worker, caller = client(port), client(port)
+    await worker.connect()
+    published = asyncio.get_event_loop().create_future()
+    worker.publish_service('echo', Echo(), published.set_result)
+    await published
+    await caller.connect()
+    ping = caller.get_service('echo').ping
+    payload = {'id': 1, 'name': 'user', 'tags': ['a', 'b', 'c']}
+    samples = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await caller.request(ping, payload)
+        samples.append(time.perf_counter() - start)
+    worker.close()
+    caller.close()
+    return percentiles(samples)
+
+
+async def bench_fanout(port, subscribers, messages):
+    loop = asyncio.get_event_loop()
+    clients, finished = [], []
+    for i in range(subscribers):
+        listener = client(port)
+        await listener.connect()
+        joined, done = loop.create_future(), loop.create_future()
+        listener.join_channel('bench', Counter(messages, done), True,
+                lambda channel, name, joined=joined: joined.set_result(name))
+        await joined
+        clients.append(listener)
+        finished.append(done)
+    writer = client(port)
+    await writer.connect()
+    channel = writer.get_channel('bench')
+    start = time.perf_counter()
+    for i in range(messages):
+        channel.message(i)
+    await asyncio.gather(*finished)
+    elapsed = time.perf_counter() - start
+    for bridge in clients + [writer]:
+        bridge.close()
+    return {
+        'subscribers': subscribers,
+        'messages': messages,
+        'seconds': elapsed,
+        'delivered_per_second': subscribers * messages / elapsed,
+    }
+
+
+def bench_serializer(iterations):
+    bridge = Bridge(host='127.0.0.1', port=1, loop='asyncio')
+    bridge._connection.client_id = 'bench'
+    callback = lambda *args: None
+    payloads = {
+        'small': ['lobby', 'hello world', callback],
+        'records': [[{'id': i, 'name': 'user%d' % i, 'score': i * 1.5, 'tags': ['a', 'b']}
+            for i in range(100)]],
+        'callbacks': [dict(('cb%d' % i, callback) for i in range(20))],
+    }
+    results = {}
+    for label, payload in sorted(payloads.items()):
+        data = codec.default.encode(serializer.serialize(bridge, payload))
+        parsed = codec.default.decode(data)
+        encode = timeit.timeit(lambda: codec.default.encode(serializer.serialize(bridge, payload)),
+            number=iterations)
+        decode = timeit.timeit(lambda: serializer.unserialize(bridge, codec.default.decode(data)),
+            number=iterations)
+        unserialize = timeit.timeit(lambda: serializer.unserialize(bridge, parsed), number=iterations)
+        results[label] = {
+            'bytes': len(data),
+            'serialize_encode_us': encode / iterations * 1e6,
+            'decode_unserialize_us': decode / iterations * 1e6,
+            'unserialize_us': unserialize / iterations * 1e6,
+        }
+    return results
+
+
+async def bench_reconnect(server, port, clients):
+    loop = asyncio.get_event_loop()
+    bridges = []
+    for i in range(clients):
+        bridge = client(port, reconnect_base=50, reconnect_cap=2000)
+        await bridge.connect()
+        bridges.append(bridge)
+    resumed = []
+    for bridge in bridges:
+        future = loop.create_future()
+        bridge.on('reconnect', lambda future=future: future.done() or future.set_result(time.perf_counter()))
+        resumed.append(future)
+    resumes = server.stats['resumes']
+    start = time.perf_counter()
+    server.drop_all()
+    times = [t - start for t in await asyncio.gather(*resumed)]
+    for bridge in bridges:
+        bridge.close()
+    result = percentiles(times)
+    result['clients'] = clients
+    result['resumed_sessions'] = server.stats['resumes'] - resumes
+    return result
+
+
+async def run(scale):
+    server = FakeServer()
+    port = await server.start()
+    try:
+        return {
+            'rpc_latency_seconds': await bench_rpc(port, 2000 * scale),
+            'channel_fanout': await bench_fanout(port, 10 * scale, 500 * scale),
+            'reconnect_storm_seconds': await bench_reconnect(server, port, 50 * scale),
+        }
+    finally:
+        server.close()
+
+
+def main(output='bench_results.json', scale=1):
+    logging.basicConfig(level=logging.ERROR)
+    scale = int(scale)
+    results = {
+        'python': platform.python_version(),
+        'codec': codec.default.name,
+        'serializer': bench_serializer(2000 * scale),
+    }
+    results.update(asyncio.run(run(scale)))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+'''Measures what the wire trace costs per received message.
+
+Usage: python bench/bench_trace.py [iterations]
+'''
+import sys
+import json
+import timeit
+import logging
+
+from BridgePython import trace
+from BridgePython.bridge import Bridge
+
+
+class Service(object):
+    def message(self, text):
+        pass
+
+
+def main(iterations=100000):
+    logger = logging.getLogger('bench.wire')
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    data = json.dumps({
+        'destination': {'ref': ['named', 'chat', 'chat', 'message']},
+        'args': ['x' * 1024],
+    }).encode('utf-8')
+    bridge = Bridge(host='localhost', port=8090)
+    bridge.store_service('chat', Service())
+    cases = [
+        ('off', None),
+        ('logger disabled', trace.WireTrace(level=logging.DEBUG, logger=logger)),
+        ('sampled 1/100', trace.WireTrace(sample=100, logger=logger)),
+        ('every message', trace.WireTrace(logger=logger)),
+    ]
+    print('%-16s %12s' % ('trace', 'us/message'))
+    for label, wire in cases:
+        logger.setLevel(logging.INFO if label == 'logger disabled' else logging.DEBUG)
+        bridge._trace = wire
+        seconds = timeit.timeit(lambda: bridge._connection.process_message({'data': data}, None),
+            number=iterations)
+        print('%-16s %12.2f' % (label, seconds / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
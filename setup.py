@@ -15,6 +15,6 @@ setup(
     description='A Python API for the Bridge service.',
     long_description=read('README.md'),
     requires=[
-        "tornado (>= 2.2)",
+        "tornado (>= 4.0)",
     ]
 )
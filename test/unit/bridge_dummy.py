@@ -1,4 +1,5 @@
 import reference_dummy
+import connection_dummy
 
 class BridgeDummy():
     def __init__(self):
@@ -7,8 +8,11 @@ class BridgeDummy():
                          'log': 2 # 0 for no output
                         }
         self.stored = []
+        self._connection = connection_dummy.ConnectionDummy()
+        self._store = {}
+        self._trace = None
     
-    def _store_object(self, handler, ops):
+    def _store_object(self, handler, ops, once=False):
         self.stored.append([handler, ops])
         return reference_dummy.ReferenceDummy()
 
@@ -1,8 +1,17 @@
+import stream_dummy
+
 class ConnectionDummy():
     def __init__(self):
         self.messages = []
         self.onopened = False
-        self.options = {'host': 'localhost', 'port': 8090}
+        self.client_id = None
+        self.options = {'host': 'localhost', 'port': 8090, 'secure': False,
+                        'batch': False, 'batch_bytes': 65536, 'batch_latency': 0,
+                        'compress_threshold': 16384, 'compress_offload': 1048576,
+                        'write_high': None, 'write_low': None}
+        self.send_stats = {'frames': 0, 'bytes': 0, 'writes': 0,
+                           'flushes': 0, 'batched_frames': 0, 'compressed': 0}
+        self.loop = stream_dummy.LoopDummy()
 
     def onopen(self, *args):
         self.onopened = True
@@ -10,6 +19,6 @@ class ConnectionDummy():
     def onclose(self, *args):
         return
 
-    def onmessage(data, tcp):
-        messages += data['data']
+    def onframes(self, frames, tcp):
+        self.messages.extend(frames)
 
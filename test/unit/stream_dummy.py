@@ -0,0 +1,40 @@
+class StreamDummy():
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def closed(self):
+        return False
+
+
+class LoopDummy():
+    def __init__(self):
+        self.callbacks = []
+        self.timeouts = []
+        self.futures = []
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+    def add_callback(self, callback, *args):
+        self.callbacks.append((callback, args))
+
+    def add_timeout(self, deadline, callback, *args):
+        self.timeouts.append((deadline, callback, args))
+
+    def add_future(self, future, callback):
+        self.futures.append((future, callback))
+
+    def run_futures(self):
+        futures, self.futures = self.futures, []
+        for future, callback in futures:
+            future.result()
+            callback(future)
+
+    def run_callbacks(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
@@ -1,12 +1,34 @@
 import unittest
 
-import test_util, test_serializer, test_tcp, test_reference
+import test_util, test_serializer, test_tcp, test_reference, test_store, test_codec, test_executor, test_aio, test_connection, test_rpc, test_pool, test_fakeserver, test_metrics, test_trace, test_stream, test_dispatch
 
 suite = unittest.TestSuite([test_util.TestUtil('test_generate_guid'),
                             test_util.TestUtil('test_stringify_and_parse'),
                             test_util.TestUtil('test_generate_guid'),
                             test_serializer.TestSerializer('test_serialize'),
                             test_serializer.TestSerializer('test_unserialize'),
-                            test_reference.TestReference('test_reference')])
+                            test_serializer.TestSerializer('test_serialize_tuple'),
+                            test_serializer.TestSerializer('test_serialize_reuse'),
+                            test_serializer.TestSerializer('test_unserialize_deep'),
+                            test_serializer.TestSerializer('test_ref_hook'),
+                            test_util.TestUtil('test_find_ops'),
+                            test_reference.TestReference('test_reference'),
+                            test_reference.TestReference('test_cached'),
+                            test_reference.TestReference('test_interned'),
+                            unittest.defaultTestLoader.loadTestsFromTestCase(test_tcp.TestTcp),
+                            unittest.defaultTestLoader.loadTestsFromTestCase(test_tcp.TestBatching),
+                            unittest.defaultTestLoader.loadTestsFromTestCase(test_tcp.TestCompression),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_store),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_codec),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_executor),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_aio),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_connection),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_rpc),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_pool),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_fakeserver),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_metrics),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_trace),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_stream),
+                            unittest.defaultTestLoader.loadTestsFromModule(test_dispatch)])
 suite.run(unittest.TestResult())
 unittest.TextTestRunner().run(suite)
\ No newline at end of file
@@ -0,0 +1,61 @@
+from BridgePython.bridge import Bridge
+from BridgePython import aio, tcp
+import unittest
+import asyncio
+import struct
+import json
+
+def frame(obj):
+    data = obj if isinstance(obj, bytes) else json.dumps(obj).encode('utf-8')
+    return struct.pack('>I', len(data)) + data
+
+
+class ServerProtocol(asyncio.Protocol):
+    '''Answers CONNECT and calls back the last argument of every SEND.'''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.decoder = tcp.FrameDecoder()
+
+    def data_received(self, data):
+        for message in self.decoder.feed(data):
+            message = json.loads(message)
+            if message['command'] == 'CONNECT':
+                self.transport.write(frame(b'client|secret'))
+            elif message['command'] == 'SEND':
+                args = message['data']['args']
+                callback = args[-1]
+                self.transport.write(frame({
+                    'args': [sum(args[:-1])],
+                    'destination': {'ref': callback['ref'] + ['callback']},
+                }))
+
+
+class Adder(object):
+    async def add(self, a, b, callback):
+        await asyncio.sleep(0)
+        callback(a + b)
+
+
+class TestAio(unittest.TestCase):
+    def test_connect_and_call(self):
+        async def run():
+            loop = asyncio.get_event_loop()
+            server = await loop.create_server(ServerProtocol, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            bridge = Bridge(host='127.0.0.1', port=port, loop='asyncio', reconnect=False)
+            self.assertIs(bridge, await asyncio.wait_for(bridge.connect(), 5))
+            self.assertEqual('client', bridge._connection.client_id)
+            result = await asyncio.wait_for(aio.call(bridge.get_service('adder').add, 1, 2), 5)
+            self.assertEqual(3, result)
+            server.close()
+        asyncio.run(run())
+
+    def test_coroutine_handler(self):
+        async def run():
+            bridge = Bridge(host='127.0.0.1', port=1, loop='asyncio')
+            bridge.store_service('adder', Adder())
+            future = asyncio.get_event_loop().create_future()
+            bridge._execute(['named', 'adder', 'adder', 'add'], [1, 2, future.set_result])
+            self.assertEqual(3, await asyncio.wait_for(future, 5))
+        asyncio.run(run())
@@ -0,0 +1,75 @@
+from BridgePython import codec
+from BridgePython.reference import RefDict
+import unittest
+
+class TestCodec(unittest.TestCase):
+    def available(self):
+        found = []
+        for name in codec.preference:
+            try:
+                found.append(codec.get_codec(name))
+            except ImportError:
+                pass
+        return found
+
+    def test_round_trip(self):
+        data = {'a': 1, 'b': 'test code é', 'c': {}, 'd': [1, False, None, 'asdf', {'a': 1.5}]}
+        for impl in self.available():
+            encoded = impl.encode(data)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(data, impl.decode(encoded))
+
+    def test_default_str(self):
+        for impl in self.available():
+            self.assertEqual([str(object)], impl.decode(impl.encode([object])))
+
+    def test_get_codec(self):
+        self.assertEqual('json', codec.get_codec('json').name)
+        self.assertIn(codec.get_codec().name, codec.preference)
+        impl = codec.JsonCodec()
+        self.assertIs(impl, codec.get_codec(impl))
+        self.assertRaises(ValueError, codec.get_codec, 'jsn')
+
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+@unittest.skipIf(msgpack is None, 'msgpack is not installed')
+class TestMsgpack(unittest.TestCase):
+    def test_round_trip(self):
+        impl = codec.get_codec('msgpack')
+        data = {'a': 1, 'b': 'test code é', 'c': b'\x00\xff', 'd': [1, False, None, {'a': 1.5}]}
+        self.assertEqual(data, impl.decode(impl.encode(data)))
+        self.assertEqual([[1, 2], str(object)], impl.decode(impl.encode([(1, 2), object])))
+
+    def test_refs(self):
+        impl = codec.get_codec('msgpack')
+        ref = RefDict(ref=['client', 'id', 'key'], operations=['callback'])
+        destination = RefDict(ref=['named', 'chat', 'chat', 'message'])
+        data = impl.encode({'args': [ref], 'destination': destination})
+        decoded = impl.decode(data)
+        self.assertIs(RefDict, type(decoded['args'][0]))
+        self.assertEqual(ref, decoded['args'][0])
+        self.assertEqual(destination, decoded['destination'])
+        # The hook sees refs only
+        seen = []
+        decoded = impl.decode(data, lambda obj: seen.append(obj) or 'hooked')
+        self.assertEqual(['hooked'], decoded['args'])
+        self.assertEqual([ref, destination], sorted(seen, key=len, reverse=True))
+
+    def test_decode_many(self):
+        impl = codec.get_codec('msgpack')
+        ref = RefDict(ref=['client', 'id', 'key'], operations=['callback'])
+        messages = [{'args': [ref, b'\x00'], 'destination': RefDict(ref=['named', 'a', 'a', 'go'])},
+                    {'args': [{'nested': [ref]}], 'destination': RefDict(ref=['channel', 'b', 'channel:b', 'go'])}]
+        decoded = impl.decode_many([impl.encode(message) for message in messages])
+        self.assertEqual(messages, decoded)
+        self.assertIs(RefDict, type(decoded[0]['args'][0]))
+        self.assertIs(RefDict, type(decoded[1]['args'][0]['nested'][0]))
+        self.assertIs(RefDict, type(decoded[1]['destination']))
+
+    def test_available_encodings(self):
+        self.assertEqual(['msgpack'], codec.available_encodings(['cbor', 'msgpack']))
@@ -0,0 +1,300 @@
+from BridgePython.bridge import Bridge
+from BridgePython import connection, tcp, codec, reference
+import unittest
+import asyncio
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+from stream_dummy import LoopDummy, StreamDummy
+from tcp_dummy import TcpDummy
+
+
+class TransportDummy():
+    def __init__(self, conn):
+        conn.opened.set_result((conn.options['host'], conn.options['port']))
+
+
+class TestRedirector(unittest.TestCase):
+    def setUp(self):
+        connection.EndpointCache.memory.clear()
+        self.requests = []
+
+    async def serve(self, reader, writer):
+        # Minimal HTTP stub standing in for the redirector
+        line = await reader.readline()
+        self.requests.append(line.split()[1].decode())
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        body = json.dumps({'data': {'bridge_host': 'example.com', 'bridge_port': '8091'}}).encode()
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % len(body) + body)
+        await writer.drain()
+        writer.close()
+
+    async def resolve(self, port, **kwargs):
+        bridge = Bridge(api_key='key', redirector='http://127.0.0.1:%d' % port,
+                        loop='asyncio', **kwargs)
+        conn = bridge._connection
+        conn.transport = TransportDummy
+        conn.opened = asyncio.get_event_loop().create_future()
+        conn.start()
+        return await asyncio.wait_for(conn.opened, 5)
+
+    def test_fetch_and_cache(self):
+        path = os.path.join(tempfile.mkdtemp(), 'endpoints.json')
+        async def run():
+            server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            self.assertEqual(('example.com', 8091), await self.resolve(port, redirector_cache=path))
+            self.assertEqual(['/redirect/key'], self.requests)
+            self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+            with open(path) as f:
+                self.assertNotIn('key', ''.join(json.load(f)))
+            # Served from memory
+            self.assertEqual(('example.com', 8091), await self.resolve(port))
+            self.assertEqual(1, len(self.requests))
+            # Served from disk after a restart
+            connection.EndpointCache.memory.clear()
+            self.assertEqual(('example.com', 8091), await self.resolve(port, redirector_cache=path))
+            self.assertEqual(1, len(self.requests))
+            # Expired, so asked again
+            self.assertEqual(('example.com', 8091), await self.resolve(port, redirector_ttl=0))
+            self.assertEqual(2, len(self.requests))
+            server.close()
+        asyncio.run(run())
+
+    def test_fallback(self):
+        async def run():
+            server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            await self.resolve(port)
+            server.close()
+            await server.wait_closed()
+            self.assertEqual(('example.com', 8091), await self.resolve(port, redirector_ttl=0))
+        asyncio.run(run())
+
+    def test_cached_refused(self):
+        path = os.path.join(tempfile.mkdtemp(), 'endpoints.json')
+        async def run():
+            server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            closed = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+            refused = closed.sockets[0].getsockname()[1]
+            closed.close()
+            await closed.wait_closed()
+            key = connection.EndpointCache.key('http://127.0.0.1:%d' % port, 'key')
+            connection.EndpointCache(path).put(key, '127.0.0.1', refused)
+            bridge = Bridge(api_key='key', redirector='http://127.0.0.1:%d' % port,
+                            loop='asyncio', redirector_cache=path, reconnect_base=1)
+            conn = bridge._connection
+            real = conn.transport
+            conn.transport = lambda conn: (real if conn.options['port'] == refused else TransportDummy)(conn)
+            conn.opened = asyncio.get_event_loop().create_future()
+            with self.assertLogs(level='WARNING'):
+                conn.start()
+                self.assertEqual(('example.com', 8091), await asyncio.wait_for(conn.opened, 5))
+            self.assertEqual(['/redirect/key'], self.requests)
+            with open(path) as f:
+                self.assertEqual(['example.com', 8091], json.load(f)[key][:2])
+            server.close()
+        asyncio.run(run())
+
+
+class TestReconnect(unittest.TestCase):
+    def test_policy(self):
+        policy = connection.ReconnectPolicy(base=100, cap=1000, jitter=0)
+        self.assertEqual([100, 200, 400, 800, 1000, 1000],
+                         [policy.delay(i) for i in range(6)])
+        self.assertEqual(1000, policy.delay(1000))
+        policy = connection.ReconnectPolicy(base=100, cap=1000, jitter=0.5)
+        for i in range(100):
+            self.assertTrue(50 <= policy.delay(0) <= 100)
+
+    def test_max_attempts(self):
+        bridge = Bridge(host='localhost', port=8090, reconnect_attempts=2)
+        failed = []
+        bridge.on('reconnect_failed', lambda: failed.append(True))
+        conn = bridge._connection
+        conn.loop = LoopDummy()
+        for i in range(3):
+            conn.onclose()
+        self.assertEqual(2, len(conn.loop.timeouts))
+        self.assertEqual([True], failed)
+
+
+def loop_bridge(**kwargs):
+    # A bridge whose sends are made as if from the loop thread
+    bridge = Bridge(**kwargs)
+    bridge._connection.loop_thread = threading.current_thread()
+    return bridge
+
+
+class TestSockBuffer(unittest.TestCase):
+    def test_drop(self):
+        bridge = loop_bridge(host='localhost', port=8090, buffer_limit=2)
+        dropped = []
+        bridge.on('dropped', dropped.append)
+        for i in range(3):
+            bridge._connection.send_command('GETCHANNEL', {'name': str(i)})
+        self.assertEqual(2, len(bridge._connection.sock_buffer.buffer))
+        self.assertEqual(1, len(dropped))
+
+    def test_error(self):
+        bridge = loop_bridge(host='localhost', port=8090, buffer_limit=1, buffer_policy='error')
+        bridge._connection.send_command('GETCHANNEL', {'name': 'a'})
+        self.assertRaises(connection.BufferFull, bridge._connection.send_command,
+                          'GETCHANNEL', {'name': 'b'})
+
+    def test_flush(self):
+        bridge = loop_bridge(host='localhost', port=8090, buffer_flush=2, codec='orjson')
+        conn = bridge._connection
+        conn.loop = LoopDummy()
+        callback = lambda name: None
+        for i in range(3):
+            bridge.publish_service('svc%d' % i, object(), callback)
+        sock = TcpDummy()
+        sock.sent = []
+        sock.send = sock.sent.append
+        conn.onconnectmessage({'data': b'abc|def'}, sock)
+        self.assertEqual(2, len(sock.sent))
+        self.assertIs(conn.sock_buffer, conn.sock)
+        conn.loop.run_callbacks()
+        self.assertEqual(3, len(sock.sent))
+        self.assertIs(sock, conn.sock)
+        for msg in sock.sent:
+            self.assertEqual('abc', json.loads(msg)['data']['callback']['ref'][1])
+
+    def test_before_loop(self):
+        # Sends are handed to the loop until it has run a callback
+        bridge = Bridge(host='localhost', port=8090)
+        conn = bridge._connection
+        conn.loop = LoopDummy()
+        conn.send_command('GETCHANNEL', {'name': 'a'})
+        self.assertEqual(0, len(conn.sock_buffer.buffer))
+        conn.onloop()
+        conn.loop.run_callbacks()
+        self.assertTrue(conn.on_loop_thread())
+        self.assertEqual(1, len(conn.sock_buffer.buffer))
+
+
+class FutureStream(StreamDummy):
+    # Writes complete when the test resolves their futures
+    def __init__(self):
+        StreamDummy.__init__(self)
+        self.futures = []
+
+    def write(self, data):
+        StreamDummy.write(self, data)
+        future = concurrent.futures.Future()
+        self.futures.append(future)
+        return future
+
+
+class TcpFutures(tcp.Tcp):
+    def connect(self):
+        self.stream = FutureStream()
+
+
+def channel_send(text):
+    return {'args': [text], 'destination': {'ref': ['channel', 'lobby', 'channel:lobby', 'message']}}
+
+
+class TestWatermarks(unittest.TestCase):
+    def setUp(self):
+        self.bridge = loop_bridge(host='localhost', port=8090, write_high=20, write_low=10, write_policy='drop')
+        self.conn = self.bridge._connection
+        self.conn.loop = LoopDummy()
+        self.conn.sock = self.tcp = TcpFutures(self.conn)
+
+    def test_drop_and_drain(self):
+        dropped, drained = [], []
+        self.bridge.on('dropped', dropped.append)
+        self.bridge.on('drain', lambda: drained.append(True))
+        self.conn.send_command('SEND', channel_send('hello'))
+        self.assertTrue(self.conn.saturated)
+        future = self.bridge.drain()
+        self.assertFalse(future.done())
+        self.conn.send_command('SEND', channel_send('dropped'))
+        self.conn.send_command('JOINCHANNEL', {'name': 'lobby'})
+        self.assertEqual(1, len(dropped))
+        self.assertEqual(2, len(self.tcp.stream.written))
+        self.assertEqual(self.tcp.unsent, self.tcp.write_buffer_size())
+        for written in self.tcp.stream.futures:
+            written.set_result(None)
+        self.conn.loop.run_futures()
+        self.assertFalse(self.conn.saturated)
+        self.assertEqual([True], drained)
+        self.assertTrue(future.done())
+        self.assertTrue(self.bridge.drain().done())
+
+    def test_error(self):
+        self.conn.options['write_policy'] = 'error'
+        self.conn.send_command('SEND', channel_send('hello'))
+        self.assertRaises(connection.WriteBufferFull, self.conn.send_command, 'SEND', channel_send('again'))
+
+
+class Ticker(object):
+    def __init__(self, loop):
+        self.loop = loop
+        self.ticks = []
+
+    def tick(self, n):
+        self.ticks.append(n)
+        self.loop.now += 0.002
+
+
+def tick_frame(n):
+    return json.dumps({'args': [n], 'destination': {'ref': ['named', 'ticker', 'ticker', 'tick']}}).encode('utf-8')
+
+
+class TestInbound(unittest.TestCase):
+    def setUp(self):
+        self.bridge = Bridge(host='localhost', port=8090, metrics=True, inbound_budget=5)
+        self.conn = self.bridge._connection
+        self.conn.loop = LoopDummy()
+        self.conn.onmessage = self.conn.process_message
+        self.ticker = Ticker(self.conn.loop)
+        self.bridge.publish_service('ticker', self.ticker)
+
+    def test_budget(self):
+        # Yielding is not logged, unlike pausing for executors
+        with self.assertNoLogs(level='INFO'):
+            self.conn.onframes([tick_frame(n) for n in range(5)], self.conn.sock)
+            self.conn.loop.run_callbacks()
+        self.assertEqual([0, 1, 2, 3, 4], self.ticker.ticks)
+        self.conn.loop.now = 0
+        self.conn.onframes([tick_frame(n) for n in range(5)], self.conn.sock)
+        self.assertEqual([0, 1, 2, 3, 4, 0, 1, 2], self.ticker.ticks)
+        self.assertTrue(self.conn.yielded)
+        self.assertFalse(self.conn.pausers)
+        self.conn.onframes([tick_frame(5)], self.conn.sock)
+        self.assertEqual(8, len(self.ticker.ticks))
+        self.conn.loop.run_callbacks()
+        self.assertEqual([0, 1, 2, 3, 4, 0, 1, 2, 3, 4, 5], self.ticker.ticks)
+        self.assertFalse(self.conn.yielded)
+        batches = self.bridge.get_metrics().snapshot()['inbound_batch']
+        self.assertEqual((4, 11), (batches['count'], batches['sum']))
+
+    def test_ref_hook(self):
+        self.conn.use_codec(codec.JsonCodec())
+        hook, seen = self.conn.hook, []
+        self.conn.hook = lambda obj: seen.append(obj) or hook(obj)
+        # Refs are converted while parsing, not by walking messages after
+        unserialize = connection.serializer.unserialize
+        connection.serializer.unserialize = None
+        self.addCleanup(setattr, connection.serializer, 'unserialize', unserialize)
+        ref = {'ref': ['client', 'other', 'obj'], 'operations': ['a']}
+        frame = json.dumps({'args': [ref], 'destination': {'ref': ['named', 'ticker', 'ticker', 'tick']}}).encode('utf-8')
+        for frames in ([frame, frame], [frame], [frame, b'{"args": [', frame]):
+            self.conn.onframes(frames, self.conn.sock)
+        self.assertEqual(5, len(self.ticker.ticks))
+        for tick in self.ticker.ticks:
+            self.assertIsInstance(tick, reference.Reference)
+            self.assertEqual(['client', 'other', 'obj'], tick._address)
+        self.assertTrue(seen)
+
+    def test_parse_error(self):
+        self.conn.onframes([tick_frame(1), b'{"args": [', tick_frame(2)], self.conn.sock)
+        self.assertEqual([1, 2], self.ticker.ticks)
+        self.assertEqual(1, self.bridge.get_metrics().snapshot()['parse_errors'])
@@ -0,0 +1,93 @@
+from BridgePython.bridge import Bridge
+import unittest
+
+
+class Greeter(object):
+    def __init__(self, greeting):
+        self.greeting = greeting
+        self.said = []
+
+    def greet(self, name, punctuation='!'):
+        self.said.append(self.greeting + name + punctuation)
+
+    def log(self, *lines):
+        self.said.extend(lines)
+
+
+def positive(value, *rest):
+    if value <= 0:
+        raise ValueError('not positive')
+
+
+class Counter(object):
+    def __init__(self):
+        self.total = 0
+
+    def add(self, value):
+        self.total += value
+
+
+class Who(object):
+    def __init__(self, bridge):
+        self.bridge = bridge
+        self.callers = []
+
+    def ask(self):
+        self.callers.append(self.bridge.context())
+
+
+class TestDispatch(unittest.TestCase):
+    def setUp(self):
+        self.bridge = Bridge(host='localhost', port=8090, metrics=True)
+
+    def test_arity(self):
+        greeter = Greeter('hi ')
+        self.bridge.publish_service('greeter', greeter)
+        self.bridge._execute(['named', 'greeter', 'greeter', 'greet'], ['a'])
+        self.bridge._execute(['named', 'greeter', 'greeter', 'greet'], ['b', '?'])
+        self.bridge._execute(['named', 'greeter', 'greeter', 'greet'], [])
+        self.bridge._execute(['named', 'greeter', 'greeter', 'greet'], ['c', '.', 'extra'])
+        self.bridge._execute(['named', 'greeter', 'greeter', 'log'], ['x', 'y', 'z'])
+        self.assertEqual(['hi a!', 'hi b?', 'x', 'y', 'z'], greeter.said)
+        self.assertEqual(2, self.bridge.get_metrics().snapshot()['rejected_calls'])
+
+    def test_validators(self):
+        counter = Counter()
+        self.bridge.publish_service('counter', counter, validators={'add': positive})
+        for value in [1, -5, 2]:
+            self.bridge._execute(['named', 'counter', 'counter', 'add'], [value])
+        self.assertEqual(3, counter.total)
+
+    def test_republish(self):
+        first, second = Greeter('hi '), Greeter('hello ')
+        self.bridge.publish_service('greeter', first)
+        self.bridge.publish_service('greeter', second)
+        self.bridge._execute(['named', 'greeter', 'greeter', 'greet'], ['a'])
+        self.assertEqual([], first.said)
+        self.assertEqual(['hello a!'], second.said)
+
+    def test_channel_and_timing(self):
+        counter = Counter()
+        self.bridge.join_channel('totals', counter, validators={'add': positive})
+        self.bridge._store['system'].hookChannelHandler('totals', counter)
+        self.bridge._execute(['channel', 'totals', 'channel:totals', 'add'], [2])
+        self.bridge._execute(['channel', 'totals', 'channel:totals', 'add'], [0])
+        self.assertEqual(2, counter.total)
+        timing = self.bridge.get_metrics().snapshot()['handler_seconds{handler="channel:totals.add"}']
+        self.assertEqual(1, timing['count'])
+
+    def test_context(self):
+        who = Who(self.bridge)
+        self.bridge.publish_service('who', who)
+        self.bridge._execute(['named', 'who', 'who', 'ask'], [], 'abc')
+        self.bridge._execute(['named', 'who', 'who', 'ask'], [], 'abc')
+        self.bridge._execute(['named', 'who', 'who', 'ask'], [])
+        first, second, third = who.callers
+        self.assertEqual('abc', first.clientId)
+        self.assertIs(first, second)
+        self.assertIsNone(third)
+        self.assertIsNone(self.bridge.context())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from BridgePython.bridge import Bridge
+from BridgePython import executor, reference
+from stream_dummy import LoopDummy
+import unittest
+import threading
+import time
+
+class Service(object):
+    def __init__(self):
+        self.threads = []
+
+    def work(self, value, cb):
+        self.threads.append(threading.current_thread())
+        cb(value * 2)
+
+    def remote(self, value, svc):
+        svc.store(value + 1)
+
+    @staticmethod
+    def triple(value, cb):
+        cb(value * 3)
+
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        self.bridge = Bridge(host='localhost', port=8090, executor_queue=2)
+        self.loop = self.bridge._connection.loop = LoopDummy()
+
+    def wait(self, executor):
+        deadline = time.time() + 10
+        while executor.pending and time.time() < deadline:
+            self.loop.run_callbacks()
+            time.sleep(0.01)
+        self.assertEqual(0, executor.pending)
+
+    def test_thread(self):
+        service = Service()
+        results = []
+        self.bridge.publish_service('svc', service, executor='thread')
+        pool = self.bridge._executors['svc']
+        self.assertIsInstance(pool, executor.ThreadExecutor)
+        self.bridge._execute(['named', 'svc', 'svc', 'work'], [2, results.append])
+        self.wait(pool)
+        self.assertEqual([4], results)
+        self.assertIsNot(threading.current_thread(), service.threads[0])
+        pool.shutdown()
+
+    def test_thread_context(self):
+        callers = []
+        class Who(object):
+            def ask(this):
+                callers.append(self.bridge.context().clientId)
+        self.bridge.publish_service('svc', Who(), executor='thread')
+        pool = self.bridge._executors['svc']
+        self.bridge._execute(['named', 'svc', 'svc', 'ask'], [], 'abc')
+        self.bridge._execute(['named', 'svc', 'svc', 'ask'], [], 'def')
+        self.wait(pool)
+        self.assertEqual(['abc', 'def'], sorted(callers))
+        pool.shutdown()
+
+    def test_backpressure(self):
+        gate = threading.Event()
+        class Slow(object):
+            def work(self):
+                gate.wait()
+        self.bridge.publish_service('svc', Slow(), executor='thread')
+        pool = self.bridge._executors['svc']
+        connection = self.bridge._connection
+        received = []
+        connection.onmessage = lambda message, sock: received.append(message['data'])
+        self.bridge._execute(['named', 'svc', 'svc', 'work'], [])
+        self.assertFalse(connection.pausers)
+        self.bridge._execute(['named', 'svc', 'svc', 'work'], [])
+        self.assertEqual(set([pool]), connection.pausers)
+        connection.onframes([b'{}', b'{}'], connection.sock)
+        self.assertEqual(2, len(connection.backlog))
+        gate.set()
+        self.wait(pool)
+        self.assertFalse(connection.pausers)
+        self.assertEqual(0, len(connection.backlog))
+        self.assertEqual([b'{}', b'{}'], received)
+        pool.shutdown()
+
+    def test_process_static(self):
+        results = []
+        self.bridge.publish_service('svc', Service(), executor='process')
+        pool = self.bridge._executors['svc']
+        self.bridge._execute(['named', 'svc', 'svc', 'triple'], [2, results.append])
+        self.wait(pool)
+        self.assertEqual([6], results)
+        pool.shutdown()
+
+    def test_submit_fails(self):
+        self.bridge.publish_service('svc', Service(), executor='thread')
+        pool = self.bridge._executors['svc']
+        pool.max_queue = 1
+        pool.pool = pool.create_pool()
+        pool.pool.shutdown()
+        self.bridge._execute(['named', 'svc', 'svc', 'work'], [2, lambda value: None])
+        self.assertEqual(0, pool.pending)
+        self.assertFalse(self.bridge._connection.pausers)
+        pool.pool = None
+
+    def test_process(self):
+        calls = []
+        self.bridge._send = lambda args, destination: calls.append((args, destination['ref']))
+        self.bridge.publish_service('svc', Service(), executor='process')
+        pool = self.bridge._executors['svc']
+        svc = reference.Reference(self.bridge, ['named', 'other', 'other'])
+        self.bridge._execute(['named', 'svc', 'svc', 'remote'], [1, svc])
+        self.wait(pool)
+        self.assertEqual([((2,), ['named', 'other', 'other', 'store'])], calls)
+        pool.shutdown()
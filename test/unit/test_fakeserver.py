@@ -0,0 +1,157 @@
+from BridgePython.bridge import Bridge
+from BridgePython.fakeserver import FakeServer
+import unittest
+import asyncio
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Echo(object):
+    def ping(self, value, callback):
+        callback(value)
+
+
+class Who(object):
+    def __init__(self, bridge):
+        self.bridge = bridge
+
+    async def ask(self, callback):
+        await asyncio.sleep(0)
+        callback(self.bridge.context().clientId)
+
+
+class Listener(object):
+    def __init__(self, future):
+        self.future = future
+
+    def message(self, text):
+        self.future.set_result(text)
+
+
+def bridge(port, **kwargs):
+    return Bridge(host='127.0.0.1', port=port, loop='asyncio', **kwargs)
+
+
+class TestFakeServer(unittest.TestCase):
+    def run_async(self, test, **kwargs):
+        async def run():
+            server = FakeServer(**kwargs)
+            port = await server.start()
+            try:
+                await asyncio.wait_for(test(server, port), 5)
+            finally:
+                server.close()
+        asyncio.run(run())
+
+    def test_service(self):
+        async def test(server, port):
+            worker, caller = bridge(port), bridge(port)
+            await worker.connect()
+            published = asyncio.get_event_loop().create_future()
+            worker.publish_service('echo', Echo(), published.set_result)
+            self.assertEqual('echo', await published)
+            await caller.connect()
+            self.assertEqual([1, 'a'], await caller.request(caller.get_service('echo').ping, [1, 'a']))
+            self.assertEqual(2, server.stats['connects'])
+        self.run_async(test)
+
+    def test_channel(self):
+        async def test(server, port):
+            listener, writer = bridge(port), bridge(port)
+            await listener.connect()
+            received = asyncio.get_event_loop().create_future()
+            joined = asyncio.get_event_loop().create_future()
+            listener.join_channel('lobby', Listener(received), True, lambda channel, name: joined.set_result(name))
+            self.assertEqual('lobby', await joined)
+            await writer.connect()
+            writer.get_channel('lobby').message('hello')
+            self.assertEqual('hello', await received)
+        self.run_async(test)
+
+    def test_context(self):
+        async def test(server, port):
+            worker, first, second = bridge(port), bridge(port), bridge(port)
+            published = asyncio.get_event_loop().create_future()
+            worker.publish_service('who', Who(worker), published.set_result)
+            await worker.connect()
+            await published
+            await first.connect()
+            await second.connect()
+            answers = await asyncio.gather(first.request(first.get_service('who').ask),
+                    second.request(second.get_service('who').ask))
+            self.assertEqual([first._connection.client_id, second._connection.client_id], answers)
+        self.run_async(test)
+
+    def test_missing_service(self):
+        async def test(server, port):
+            caller = bridge(port)
+            await caller.connect()
+            error = asyncio.get_event_loop().create_future()
+            caller.on('remote_error', error.set_result)
+            caller.get_service('nobody').ping(1)
+            self.assertIn('nobody', await error)
+        self.run_async(test)
+
+    def test_resume_session(self):
+        async def test(server, port):
+            client = bridge(port, reconnect_base=10, reconnect_jitter=0)
+            await client.connect()
+            id = client._connection.client_id
+            resumed = asyncio.get_event_loop().create_future()
+            client.on('reconnect', lambda: resumed.set_result(client._connection.client_id))
+            server.drop_all()
+            self.assertEqual(id, await resumed)
+            self.assertEqual(1, server.stats['resumes'])
+        self.run_async(test)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_binary_encoding(self):
+        async def test(server, port):
+            worker, caller, plain = bridge(port, encoding='msgpack'), bridge(port, encoding='msgpack'), bridge(port)
+            published = asyncio.get_event_loop().create_future()
+            worker.publish_service('echo', Echo(), published.set_result)
+            await worker.connect()
+            self.assertEqual('echo', await published)
+            await caller.connect()
+            await plain.connect()
+            self.assertEqual('msgpack', caller._connection.codec.name)
+            self.assertNotEqual('msgpack', plain._connection.codec.name)
+            echo = caller.get_service('echo')
+            self.assertEqual(b'\x00\xff', await caller.request(echo.ping, b'\x00\xff'))
+            self.assertEqual({'a': [1.5]}, await plain.request(plain.get_service('echo').ping, {'a': [1.5]}))
+        self.run_async(test)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_encoding_declined(self):
+        async def test(server, port):
+            caller = bridge(port, encoding=['msgpack'])
+            await caller.connect()
+            self.assertFalse(caller._connection.binary)
+            worker = bridge(port)
+            await worker.connect()
+            published = asyncio.get_event_loop().create_future()
+            worker.publish_service('echo', Echo(), published.set_result)
+            await published
+            self.assertEqual([1], await caller.request(caller.get_service('echo').ping, [1]))
+        self.run_async(test, encodings=[])
+
+    def test_compression(self):
+        async def test(server, port):
+            worker, caller = bridge(port, compression='zlib'), bridge(port, compression=True)
+            published = asyncio.get_event_loop().create_future()
+            worker.publish_service('echo', Echo(), published.set_result)
+            await worker.connect()
+            await published
+            await caller.connect()
+            document = {'rows': ['row %d' % i for i in range(10000)]}
+            self.assertEqual(document, await caller.request(caller.get_service('echo').ping, document))
+            self.assertEqual(1, caller.send_stats()['compressed'])
+            self.assertEqual(1, worker.send_stats()['compressed'])
+        self.run_async(test, compression=['zlib'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from BridgePython.bridge import Bridge
+from BridgePython import metrics
+import unittest
+import socket
+
+
+class Service(object):
+    def ping(self):
+        pass
+
+    def fail(self):
+        raise ValueError('fail')
+
+
+class TestMetrics(unittest.TestCase):
+    def test_snapshot(self):
+        registry = metrics.Metrics()
+        registry.inc('messages_received')
+        registry.inc('messages_received', 2)
+        registry.set('buffer_depth', 5)
+        registry.observe('handler_seconds', 0.001, (('handler', 'chat.message'),))
+        snapshot = registry.snapshot()
+        self.assertEqual(3, snapshot['messages_received'])
+        self.assertEqual(5, snapshot['buffer_depth'])
+        self.assertEqual(1, snapshot['handler_seconds{handler="chat.message"}']['count'])
+
+    def test_null_metrics(self):
+        registry = metrics.get_metrics(None)
+        self.assertFalse(registry.enabled)
+        registry.inc('messages_received')
+        registry.timing('handler_seconds', 1)
+        self.assertEqual({}, registry.snapshot())
+        self.assertEqual('', metrics.prometheus(registry))
+
+    def test_prometheus(self):
+        registry = metrics.Metrics()
+        registry.inc('parse_errors')
+        registry.set('store_size', 2)
+        registry.observe('request_seconds', 0.0007, (('method', 'a."b"'),))
+        text = metrics.prometheus(registry)
+        self.assertIn('# TYPE bridge_parse_errors_total counter\nbridge_parse_errors_total 1\n', text)
+        self.assertIn('bridge_store_size 2\n', text)
+        self.assertIn('bridge_request_seconds_bucket{method="a.\\"b\\"",le="0.0005"} 0\n', text)
+        self.assertIn('bridge_request_seconds_bucket{method="a.\\"b\\"",le="0.001"} 1\n', text)
+        self.assertIn('bridge_request_seconds_count{method="a.\\"b\\""} 1\n', text)
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        registry = metrics.Metrics()
+        exporter = metrics.StatsdExporter(registry, port=server.getsockname()[1])
+        registry.inc('messages_received', 3)
+        exporter.flush()
+        self.assertEqual(b'bridge.messages_received:3|c', server.recv(1400))
+        registry.inc('messages_received')
+        registry.set('buffer_depth', 1)
+        exporter.flush()
+        lines = server.recv(1400).split(b'\n')
+        self.assertEqual([b'bridge.messages_received:1|c', b'bridge.buffer_depth:1|g'], lines)
+        server.close()
+
+    def test_bridge(self):
+        bridge = Bridge(host='localhost', port=8090, metrics=True)
+        timings = []
+        bridge.get_metrics().add_hook(lambda name, seconds, labels: timings.append((name, labels)))
+        bridge.store_service('svc', Service())
+        bridge._execute(['named', 'svc', 'svc', 'ping'], [])
+        bridge._execute(['named', 'svc', 'svc', 'fail'], [])
+        bridge._connection.process_message({'data': b'not json'}, None)
+        self.assertEqual([('handler_seconds', (('handler', 'svc.ping'),)),
+            ('handler_seconds', (('handler', 'svc.fail'),))], timings)
+        snapshot = bridge.get_metrics().snapshot()
+        self.assertEqual(1, snapshot['handler_errors'])
+        self.assertEqual(1, snapshot['parse_errors'])
+        self.assertEqual(1, snapshot['messages_received'])
+        self.assertEqual(len(bridge._store), snapshot['store_size'])
+        self.assertEqual(0, snapshot['buffer_depth'])
+
+
+if __name__ == '__main__':
+    unittest.main()
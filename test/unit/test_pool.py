@@ -0,0 +1,115 @@
+from BridgePython.pool import BridgePool
+from BridgePython import tcp
+import unittest
+import asyncio
+import struct
+import json
+import threading
+
+
+class ServerProtocol(asyncio.Protocol):
+    '''Answers CONNECT and records the other commands of each session.'''
+
+    sessions = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.decoder = tcp.FrameDecoder()
+        self.commands = []
+        self.sessions.append(self)
+
+    def data_received(self, data):
+        for message in self.decoder.feed(data):
+            message = json.loads(message)
+            if message['command'] == 'CONNECT':
+                reply = ('client%d|secret' % len(self.sessions)).encode()
+                self.transport.write(struct.pack('>I', len(reply)) + reply)
+            else:
+                self.commands.append(message['command'])
+
+
+class TestPool(unittest.TestCase):
+    def test_pool(self):
+        ServerProtocol.sessions = []
+        async def run():
+            loop = asyncio.get_event_loop()
+            server = await loop.create_server(ServerProtocol, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = BridgePool(sessions=2, endpoints=[('127.0.0.1', port)], loop='asyncio',
+                              reconnect=False)
+            pool.publish_service('svc', object())
+            await asyncio.wait_for(pool.connect(), 5)
+            while [s['state'] for s in pool.health()] != ['ready', 'ready']:
+                await asyncio.sleep(0.01)
+            svc = pool.get_service('other')
+            for i in range(4):
+                svc.call(i)
+            pool.request(svc.call, timeout=5)
+            await asyncio.sleep(0.1)
+            commands = [s.commands for s in ServerProtocol.sessions]
+            self.assertEqual(2, len(commands))
+            for session in commands:
+                self.assertEqual('JOINWORKERPOOL', session[0])
+            self.assertEqual(5, sum(session.count('SEND') for session in commands))
+            self.assertTrue(all(session.count('SEND') >= 2 for session in commands))
+            self.assertEqual(1, sum(s['inflight'] for s in pool.health()))
+            pool.close()
+            await asyncio.sleep(0.1)
+            self.assertEqual(['closed', 'closed'], [s['state'] for s in pool.health()])
+            server.close()
+        asyncio.run(run())
+
+    def test_close_while_connecting(self):
+        ServerProtocol.sessions = []
+        async def run():
+            loop = asyncio.get_event_loop()
+            server = await loop.create_server(ServerProtocol, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = BridgePool(sessions=2, endpoints=[('127.0.0.1', port)], loop='asyncio')
+            pool.connect()
+            pool.close()
+            await asyncio.sleep(0.1)
+            self.assertEqual(['closed', 'closed'], [s['state'] for s in pool.health()])
+            self.assertEqual([None, None], [s['client_id'] for s in pool.health()])
+            server.close()
+        asyncio.run(run())
+
+    def on_loop(self, pool):
+        # Send as if from the loop thread, without connecting
+        for session in pool.sessions:
+            session.bridge._connection.loop_thread = threading.current_thread()
+            session.state = 'ready'
+        return [session.bridge._connection.sock_buffer.buffer for session in pool.sessions]
+
+    def test_reference_arguments(self):
+        pool = BridgePool(sessions=2, host='localhost', port=8090)
+        buffers = self.on_loop(pool)
+        other = pool.get_service('other')
+        for i in range(2):
+            pool.get_service('svc').go(other.reply, [other])
+        for buffer in buffers:
+            command, data = buffer[0]
+            self.assertEqual(['named', 'other', 'other'], data['args'][0]['ref'])
+            self.assertEqual(['named', 'other', 'other'], data['args'][1][0]['ref'])
+
+    def test_failover(self):
+        pool = BridgePool(sessions=2, host='localhost', port=8090)
+        buffers = self.on_loop(pool)
+        failed, healthy = pool.sessions
+        failed.bridge.get_service('svc').go(lambda: None)
+        failed.bridge.join_channel('lobby', object())
+        failed.onfailed()
+        self.assertEqual(0, len(buffers[0]))
+        self.assertEqual(['SEND'], [command for command, data in buffers[1]])
+        callback = buffers[1][0][1]['args'][0]['ref'][2]
+        self.assertIn(callback, healthy.bridge._store)
+        self.assertNotIn(callback, failed.bridge._store)
+
+    def test_least_inflight(self):
+        pool = BridgePool(sessions=3, strategy='least_inflight', host='localhost', port=8090)
+        pool.sessions[0].bridge._requests.inflight = 2
+        pool.sessions[2].bridge._requests.inflight = 1
+        self.assertIs(pool.sessions[1], pool.choose())
+        pool.sessions[1].state = 'failed'
+        self.assertIs(pool.sessions[2], pool.choose())
+        self.assertRaises(ValueError, BridgePool, strategy='random')
@@ -2,6 +2,7 @@ from BridgePython.bridge import Bridge
 from BridgePython import reference
 from bridge_dummy import BridgeDummy
 import unittest
+import threading
  
 class TestReference(unittest.TestCase):
   def test_reference(self):
@@ -16,3 +17,23 @@ class TestReference(unittest.TestCase):
       self.assertEqual(['x', 'y', 'z', 'test'], dummy.last_dest['ref'])
       self.assertNotIn('operations', dummy.last_dest)
       return
+
+  def test_cached(self):
+      dummy = BridgeDummy()
+      ref = reference.Reference(dummy, ['client', None, 'z'], ['a'])
+      self.assertIs(ref.test, ref.test)
+      self.assertIs(ref, ref.test._reference)
+      self.assertIs(ref._to_dict('test'), ref._to_dict('test'))
+      ref._bind('abc')
+      self.assertEqual(['client', 'abc', 'z', 'test'], ref._to_dict('test')['ref'])
+      self.assertEqual(['client', 'abc', 'z'], ref._to_dict()['ref'])
+      self.assertRaises(AttributeError, setattr, ref, 'other', 1)
+
+  def test_interned(self):
+      bridge = Bridge(host='localhost', port=8090)
+      bridge._connection.loop_thread = threading.current_thread()
+      self.assertIs(bridge.get_service('svc'), bridge.get_service('svc'))
+      self.assertIs(bridge.get_channel('lobby'), bridge.get_channel('lobby'))
+      self.assertIs(bridge.get_client('abc').get_service('x'), bridge.get_client('abc').get_service('x'))
+      sent = [command for command, data in bridge._connection.sock_buffer.buffer]
+      self.assertEqual(['GETCHANNEL'], sent)
@@ -0,0 +1,131 @@
+from BridgePython.bridge import Bridge
+from BridgePython import rpc, metrics, connection
+import unittest
+import asyncio
+import threading
+
+
+class TestRequests(unittest.TestCase):
+    def run_bridge(self, test, **kwargs):
+        async def run():
+            bridge = Bridge(host='localhost', port=8090, loop='asyncio', **kwargs)
+            sent = []
+            bridge._send = lambda args, destination: sent.append((args, destination))
+            await test(bridge, sent)
+        asyncio.run(run())
+
+    def test_reply(self):
+        async def test(bridge, sent):
+            future = bridge.request(bridge.get_service('svc').fetch, 1)
+            args, destination = sent[0]
+            self.assertEqual(['named', 'svc', 'svc', 'fetch'], destination['ref'])
+            self.assertEqual(1, bridge.request_stats()['inflight'])
+            args[-1].callback('result')
+            self.assertEqual('result', await future)
+            stats = bridge.request_stats()
+            self.assertEqual(0, stats['inflight'])
+            self.assertEqual(1, stats['svc.fetch']['count'])
+        self.run_bridge(test)
+
+    def test_timeout(self):
+        async def test(bridge, sent):
+            future = bridge.request(bridge.get_service('svc').fetch, timeout=0.01)
+            bridge._store_object(sent[0][0][-1], ['callback'], True)
+            self.assertEqual(1, bridge.store_stats()['stored'])
+            with self.assertRaises(rpc.RequestTimeout):
+                await future
+            self.assertEqual(1, bridge.store_stats()['released'])
+            self.assertEqual(0, bridge.request_stats()['inflight'])
+        self.run_bridge(test)
+
+    def test_max_inflight(self):
+        async def test(bridge, sent):
+            bridge.request(bridge.get_service('svc').fetch)
+            with self.assertRaises(rpc.TooManyRequests):
+                await bridge.request(bridge.get_service('svc').fetch)
+            self.assertEqual(1, len(sent))
+        self.run_bridge(test, max_inflight=1)
+
+    def test_client_key(self):
+        async def test(bridge, sent):
+            for id in ['abc', 'def']:
+                future = bridge.request(bridge.get_client(id).get_service('svc').fetch)
+                sent[-1][0][-1].callback(id)
+                await future
+            self.assertEqual(2, bridge.request_stats()['svc.fetch']['count'])
+        self.run_bridge(test)
+
+    def test_send_fails(self):
+        async def run():
+            bridge = Bridge(host='localhost', port=8090, loop='asyncio', buffer_limit=1,
+                            buffer_policy='error', max_inflight=2, request_timeout=10)
+            bridge._connection.loop_thread = threading.current_thread()
+            svc = bridge.get_client('abc').get_service('svc')
+            bridge.request(svc.fetch)
+            stored = len(bridge._store)
+            for i in range(3):
+                self.assertRaises(connection.BufferFull, bridge.request, svc.fetch)
+            self.assertEqual(1, bridge.request_stats()['inflight'])
+            self.assertEqual(stored, len(bridge._store))
+        asyncio.run(run())
+
+    def test_dropped(self):
+        async def run():
+            bridge = Bridge(host='localhost', port=8090, loop='asyncio', buffer_limit=1)
+            bridge._connection.loop_thread = threading.current_thread()
+            svc = bridge.get_service('svc')
+            queued = bridge.request(svc.fetch)
+            with self.assertRaises(rpc.RequestFailed):
+                await bridge.request(svc.fetch)
+            self.assertEqual(1, bridge.request_stats()['inflight'])
+            self.assertEqual(1, bridge.store_stats()['released'])
+            self.assertFalse(queued.done())
+        asyncio.run(run())
+
+    def test_dropped_later(self):
+        async def run():
+            bridge = Bridge(host='localhost', port=8090, loop='asyncio', buffer_limit=1,
+                            buffer_policy='error')
+            svc = bridge.get_service('svc')
+            bridge._connection.loop.add_callback(bridge._connection.onloop)
+            # Sent before the loop ran, so the buffer fills on the loop
+            futures = [bridge.request(svc.fetch) for i in range(2)]
+            with self.assertLogs(level='WARNING'):
+                with self.assertRaises(rpc.RequestFailed):
+                    await futures[1]
+            self.assertFalse(futures[0].done())
+            self.assertEqual(1, bridge.request_stats()['inflight'])
+        asyncio.run(run())
+
+    def test_close(self):
+        async def test(bridge, sent):
+            future = bridge.request(bridge.get_service('svc').fetch)
+            bridge.close()
+            with self.assertRaises(rpc.RequestFailed):
+                await future
+            self.assertEqual(0, bridge.request_stats()['inflight'])
+        self.run_bridge(test)
+
+    def test_disconnect(self):
+        async def test(bridge, sent):
+            future = bridge.request(bridge.get_service('svc').fetch)
+            bridge.emit('disconnect')
+            self.assertFalse(future.done())
+            bridge._options['reconnect'] = False
+            bridge.emit('disconnect')
+            with self.assertRaises(rpc.RequestFailed):
+                await future
+        self.run_bridge(test)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_histogram(self):
+        histogram = metrics.Histogram([1, 2, 4, 8])
+        for value in [0.5, 1.5, 1.5, 3, 100]:
+            histogram.observe(value)
+        self.assertEqual(5, histogram.count)
+        self.assertEqual(0.5, histogram.min)
+        self.assertEqual(100, histogram.max)
+        self.assertEqual(2, histogram.percentile(50))
+        self.assertEqual(100, histogram.percentile(99))
+        self.assertEqual(None, metrics.Histogram().percentile(50))
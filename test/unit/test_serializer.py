@@ -4,6 +4,7 @@ from BridgePython import util, connection, reference, serializer
 from bridge_dummy import BridgeDummy
 import reference_dummy
 import unittest
+import json
 
 class TestSerializer(unittest.TestCase):
     def test_serialize(self):
@@ -53,6 +54,24 @@ class TestSerializer(unittest.TestCase):
         self.assertEqual(expected_ser, ser)
         return
 
+    def test_serialize_tuple(self):
+        dummy = BridgeDummy()
+        test4 = lambda: 1
+        self.assertEqual([1, ["dummy", 'a']], serializer.serialize(dummy, (1, (test4, 'a'))))
+        self.assertEqual(1, len(dummy.stored))
+
+    def test_serialize_reuse(self):
+        bridge = Bridge(host='localhost', port=8090)
+        test1 = Test1()
+        test4 = lambda: 1
+        ser = serializer.serialize(bridge, [test1, test1, test4, test4])
+        self.assertEqual(ser[0], ser[1])
+        self.assertEqual(ser[2], ser[3])
+        self.assertNotEqual(ser[0], ser[2])
+        self.assertEqual(2, bridge.store_stats()['stored'])
+        once = serializer.serialize(bridge, test4, once=True)
+        self.assertNotEqual(ser[2], once)
+
     def test_unserialize(self):
         dummy = BridgeDummy()
         obj = { 'a': {'ref': ['x','x','x'], 'operations': ['a','b']},
@@ -67,11 +86,33 @@ class TestSerializer(unittest.TestCase):
 
         self.assertIsInstance(unser['a'], reference.Reference)
         self.assertIsInstance(unser['f'][1], reference.Reference)
+        self.assertTrue(callable(unser['b']['i']))
+        self.assertEqual(5, unser['c'])
 
         # Is a lambda, not a callbackreference.
         # self.assertIsInstance(unser['b']['i'], CallbackReference)
         return
 
+    def test_unserialize_deep(self):
+        dummy = BridgeDummy()
+        obj = [{'ref': ['x', 'x', 'x'], 'operations': []}]
+        for i in range(5000):
+            obj = [obj]
+        serializer.unserialize(dummy, obj)
+        for i in range(5000):
+            obj = obj[0]
+        self.assertIsInstance(obj[0], reference.Reference)
+
+    def test_ref_hook(self):
+        dummy = BridgeDummy()
+        hook = serializer.ref_hook(dummy)
+        data = b'{"args": [{"ref": ["x", "y", "z"], "operations": ["a"]}, {"ref": "abc"}], "destination": {"ref": ["a", "b", "c", "d"]}}'
+        obj = json.loads(data, object_hook=hook)
+        self.assertIsInstance(obj['args'][0], reference.Reference)
+        self.assertEqual(['a'], obj['args'][0]._operations)
+        self.assertEqual({'ref': 'abc'}, obj['args'][1])
+        self.assertEqual(['a', 'b', 'c', 'd'], obj['destination']['ref'])
+
 
 class Test1():
     def a(self):
@@ -0,0 +1,57 @@
+from BridgePython.bridge import Bridge
+from BridgePython import store, serializer
+import unittest
+import time
+
+class TestStore(unittest.TestCase):
+    def test_named(self):
+        s = store.Store(limit=1)
+        s['system'] = 'a'
+        s.add('x', 'b')
+        s.add('y', 'c')
+        self.assertEqual('a', s['system'])
+        self.assertNotIn('x', s)
+        self.assertEqual('c', s['y'])
+        self.assertEqual(1, s.stats['evicted'])
+
+    def test_lru(self):
+        s = store.Store(limit=2)
+        s.add('x', 1)
+        s.add('y', 2)
+        s['x']
+        s.add('z', 3)
+        self.assertIn('x', s)
+        self.assertNotIn('y', s)
+
+    def test_ttl(self):
+        s = store.Store(ttl=0.01)
+        s.add('x', 1)
+        time.sleep(0.02)
+        self.assertIsNone(s.get('x'))
+        self.assertEqual(1, s.stats['expired'])
+
+    def test_once_and_release(self):
+        s = store.Store()
+        s.add('x', 1, once=True)
+        s.add('y', 2)
+        s.consume('x')
+        s.consume('y')
+        self.assertNotIn('x', s)
+        self.assertTrue(s.release('y'))
+        self.assertFalse(s.release('y'))
+        self.assertEqual(0, len(s))
+
+    def test_bridge_once(self):
+        bridge = Bridge(host='localhost', port=8090)
+        calls = []
+        ref = bridge._store_object(serializer.Callback(calls.append), ['callback'], True)
+        bridge._execute(ref._address + ['callback'], [1])
+        bridge._execute(ref._address + ['callback'], [2])
+        self.assertEqual([1], calls)
+        self.assertEqual(1, bridge.store_stats()['consumed'])
+
+    def test_bridge_release(self):
+        bridge = Bridge(host='localhost', port=8090)
+        ref = bridge._store_object(serializer.Callback(lambda: 1), ['callback'])
+        self.assertTrue(ref._release())
+        self.assertEqual(None, serializer.unserialize(bridge, [ref._to_dict()])[0])
@@ -0,0 +1,127 @@
+from BridgePython.bridge import Bridge
+from BridgePython.fakeserver import FakeServer
+from BridgePython.stream import Stream, StreamError
+from BridgePython import serializer, reference
+import unittest
+import asyncio
+import io
+import os
+import hashlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Uploads(object):
+    def __init__(self):
+        self.most_queued = 0
+
+    async def upload(self, reader, callback):
+        chunks = []
+        async for chunk in reader:
+            self.most_queued = max(self.most_queued, len(reader._chunks) + 1)
+            chunks.append(chunk)
+        callback(hashlib.sha1(b''.join(chunks)).hexdigest(), len(chunks))
+
+    def upload_text(self, reader, callback):
+        chunks = []
+        reader.read(chunks.append, lambda: callback(chunks))
+
+    def upload_blocking(self, reader, callback):
+        # Runs on an executor thread
+        callback(sum(len(chunk) for chunk in reader))
+
+    def ignore(self, reader, callback):
+        callback(None)
+
+    async def upload_failing(self, reader, callback):
+        try:
+            async for chunk in reader:
+                pass
+        except StreamError as e:
+            callback(str(e))
+
+
+def failing():
+    yield b'ok'
+    raise ValueError('source broke')
+
+
+class TestStream(unittest.TestCase):
+    def run_async(self, test, executor=None, **kwargs):
+        async def run():
+            server = FakeServer()
+            port = await server.start()
+            worker = Bridge(host='127.0.0.1', port=port, loop='asyncio', **kwargs)
+            caller = Bridge(host='127.0.0.1', port=port, loop='asyncio', **kwargs)
+            published = asyncio.get_event_loop().create_future()
+            uploads = Uploads()
+            worker.publish_service('uploads', uploads, published.set_result, executor)
+            await worker.connect()
+            await published
+            await caller.connect()
+            try:
+                await asyncio.wait_for(test(caller, caller.get_service('uploads'), uploads), 5)
+            finally:
+                server.close()
+            # Both ends dropped what they stored for the stream
+            self.assertEqual(1, len(caller._store))
+            self.assertEqual(2, len(worker._store))
+        asyncio.run(run())
+
+    def test_async_iteration(self):
+        async def test(caller, uploads, handler):
+            data = bytes(bytearray(range(256))) * 400
+            result, count = await caller.request(uploads.upload, Stream(io.BytesIO(data), chunk_size=1000))
+            self.assertEqual(hashlib.sha1(data).hexdigest(), result)
+            self.assertEqual(103, count)
+            self.assertLessEqual(handler.most_queued, 8)
+        self.run_async(test)
+
+    def test_callbacks(self):
+        async def test(caller, uploads, handler):
+            text = ['hello ', 'streaming ', 'world']
+            result = await caller.request(uploads.upload_text, Stream(iter(text), chunk_size=6))
+            self.assertEqual(['hello ', 'stream', 'ing ', 'world'], result)
+        self.run_async(test)
+
+    def test_thread_iteration(self):
+        async def test(caller, uploads, handler):
+            stream = Stream([b'x' * 5000] * 20, chunk_size=1024)
+            self.assertEqual(100000, await caller.request(uploads.upload_blocking, stream))
+        self.run_async(test, 'thread')
+
+    def test_error(self):
+        async def test(caller, uploads, handler):
+            self.assertEqual('source broke', await caller.request(uploads.upload_failing, Stream(failing())))
+        self.run_async(test)
+
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_binary(self):
+        async def test(caller, uploads, handler):
+            data = os.urandom(100000)
+            result, count = await caller.request(uploads.upload, Stream(io.BytesIO(data), chunk_size=10000))
+            self.assertEqual(hashlib.sha1(data).hexdigest(), result)
+            # Not base64 encoded
+            self.assertLess(caller.send_stats()['bytes'], len(data) * 1.1)
+        self.run_async(test, encoding='msgpack')
+
+    def test_not_pulled(self):
+        async def test(caller, uploads, handler):
+            self.assertIsNone(await caller.request(uploads.ignore, Stream([b'x'], timeout=0.05)))
+            self.assertEqual(2, len(caller._store))
+            await asyncio.sleep(0.1)
+        self.run_async(test)
+
+    def test_marker(self):
+        bridge = Bridge(host='localhost', port=8090)
+        for ops in (['pull', 'cancel'], ['cancel', 'pull']):
+            ref = serializer.resolve(bridge, {'ref': ['client', 'x', 'y'], 'operations': ops})
+            self.assertIsInstance(ref, reference.Reference)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,35 +1,110 @@
 from BridgePython.bridge import Bridge
-from BridgePython import tcp as net
+from BridgePython import tcp as net, compress
 
 from connection_dummy import ConnectionDummy
+from stream_dummy import StreamDummy
 import unittest
 import struct
+import random
  
 class TestTcp(unittest.TestCase):
   def test_receive_data(self):
     dummy = ConnectionDummy()
-    # ConnectionDummy is inadequate for net.Tcp
-    tcp = net.Tcp(dummy)
-    
-    messages = ['abc', 'efghij', 'klmnop', 'rs', 't', 'uvwxyz']
-    messages_packed = map(lambda arg: struct.pack('>I', len(arg)) + arg, messages)
-    message = ''.join(messages_packed)
-    
-    messages_packed.map(lambda arg: tcp.receive_data(arg))
-    
-    self.assertTrue(dummy.onopened)
+    tcp = TcpNoConnect(dummy)
+
+    messages = [b'abc', b'efghij', b'klmnop', b'rs', b't', b'uvwxyz']
+    messages_packed = [struct.pack('>I', len(arg)) + arg for arg in messages]
+
+    for arg in messages_packed:
+      tcp.receive_data(arg)
     self.assertEqual(messages, dummy.messages)
 
     for x in range(5):
       dummy.messages = []
-      message = ''.join(messages_packed)
-      pieces = rand(len(message)) + 1
-      each_piece = len(message) // pieces
+      message = b''.join(messages_packed)
+      each_piece = random.randint(1, len(message))
       while len(message) > 0:
-        if len(message) > each_piece:
-          tcp.receive_data(message[0::each_piece])
-          message = message[each_piece::]
-        else:
-          tcp.receive_data(message)
-          message = []
+        tcp.receive_data(message[:each_piece])
+        message = message[each_piece:]
       self.assertEqual(messages, dummy.messages)
+      self.assertEqual(0, len(tcp.decoder.buffer))
+
+  def test_receive_batch(self):
+    dummy = ConnectionDummy()
+    tcp = TcpNoConnect(dummy)
+    tcp.receive_data(struct.pack('>I', 3) + b'abc' + struct.pack('>I', 2) + b'de' + struct.pack('>I', 4) + b'f')
+    self.assertEqual([b'abc', b'de'], dummy.messages)
+    tcp.receive_data(b'ghi' + struct.pack('>I', 0))
+    self.assertEqual([b'abc', b'de', b'fghi', b''], dummy.messages)
+
+
+class TcpNoConnect(net.Tcp):
+  def connect(self):
+    self.stream = StreamDummy()
+
+
+class TestBatching(unittest.TestCase):
+  def test_unbatched(self):
+    dummy = ConnectionDummy()
+    tcp = TcpNoConnect(dummy)
+    tcp.send(b'abc')
+    tcp.send(b'de')
+    self.assertEqual([b'\x00\x00\x00\x03abc', b'\x00\x00\x00\x02de'], tcp.stream.written)
+    self.assertEqual(2, dummy.send_stats['writes'])
+
+  def test_batched(self):
+    dummy = ConnectionDummy()
+    dummy.options['batch'] = True
+    tcp = TcpNoConnect(dummy)
+    tcp.send(b'abc')
+    tcp.send(b'de')
+    self.assertEqual([], tcp.stream.written)
+    self.assertEqual(1, len(dummy.loop.callbacks))
+    dummy.loop.run_callbacks()
+    self.assertEqual([b'\x00\x00\x00\x03abc\x00\x00\x00\x02de'], tcp.stream.written)
+    self.assertEqual(1, dummy.send_stats['flushes'])
+    self.assertEqual(2, dummy.send_stats['batched_frames'])
+
+  def test_batch_bytes(self):
+    dummy = ConnectionDummy()
+    dummy.options.update(batch=True, batch_bytes=10, batch_latency=5)
+    tcp = TcpNoConnect(dummy)
+    tcp.send(b'abc')
+    self.assertEqual(1, len(dummy.loop.timeouts))
+    tcp.send(b'defg')
+    self.assertEqual([b'\x00\x00\x00\x03abc\x00\x00\x00\x04defg'], tcp.stream.written)
+
+
+class TestCompression(unittest.TestCase):
+  def pair(self, **options):
+    sender, receiver = ConnectionDummy(), ConnectionDummy()
+    for dummy in (sender, receiver):
+      dummy.options.update(compress_threshold=100, **options)
+    sender_tcp, receiver_tcp = TcpNoConnect(sender), TcpNoConnect(receiver)
+    sender_tcp.compressor = receiver_tcp.compressor = compress.ZlibCompressor()
+    return sender, sender_tcp, receiver, receiver_tcp
+
+  def test_round_trip(self):
+    sender, sender_tcp, receiver, receiver_tcp = self.pair()
+    messages = [b'a' * 1000, b'small', bytes(bytearray(range(256)))]
+    for message in messages:
+      sender_tcp.send(message)
+    self.assertEqual(1, sender.send_stats['compressed'])
+    self.assertTrue(sender_tcp.stream.written[0][0] & 0x80)
+    self.assertLess(len(sender_tcp.stream.written[0]), 100)
+    # Incompressible frames go out as they are
+    self.assertEqual(256 + 4, len(sender_tcp.stream.written[2]))
+    receiver_tcp.receive_data(b''.join(sender_tcp.stream.written))
+    self.assertEqual(messages, receiver.messages)
+
+  def test_offload_keeps_order(self):
+    sender, sender_tcp, receiver, receiver_tcp = self.pair(compress_offload=15)
+    sender_tcp.send(b'a' * 1000)
+    sender_tcp.send(b'small')
+    self.assertEqual([], sender_tcp.stream.written)
+    sender.loop.run_futures()
+    self.assertEqual(2, len(sender_tcp.stream.written))
+    receiver_tcp.receive_data(b''.join(sender_tcp.stream.written))
+    self.assertEqual([], receiver.messages)
+    receiver.loop.run_futures()
+    self.assertEqual([b'a' * 1000, b'small'], receiver.messages)
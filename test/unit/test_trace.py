@@ -0,0 +1,49 @@
+from BridgePython.bridge import Bridge
+from BridgePython import trace
+import unittest
+import logging
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test.wire')
+        self.logger.propagate = False
+        self.capture = Capture()
+        self.logger.addHandler(self.capture)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.capture)
+        self.logger.setLevel(logging.NOTSET)
+
+    def test_sample_and_truncate(self):
+        wire = trace.WireTrace(sample=2, limit=4, logger=self.logger)
+        for i in range(4):
+            wire.received(b'0123456789')
+        wire.sent(b'abc')
+        self.assertEqual(["Received b'0123'... (10 bytes)"] * 2, self.capture.messages)
+
+    def test_disabled_logger(self):
+        self.logger.setLevel(logging.INFO)
+        wire = trace.WireTrace(logger=self.logger)
+        wire.sent(b'abc')
+        self.assertEqual([], self.capture.messages)
+        self.assertEqual(0, wire.seen)
+
+    def test_bridge(self):
+        self.assertIsNone(Bridge(host='localhost', port=8090)._trace)
+        bridge = Bridge(host='localhost', port=8090, trace={'logger': self.logger})
+        bridge.get_service('chat').message('hi')
+        self.assertEqual(["Calling ['named', 'chat', 'chat'].message"], self.capture.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,3 +15,28 @@ class TestUtil(unittest.TestCase):
     def test_stringify_and_parse(self):
         data = {'a': 1, 'b': 'test code', 'c': {}, 'd': [1,False,None,'asdf',{'a': 1, 'b': 2}]}
         self.assertEqual(util.parse(util.stringify(data)), data)
+
+    def test_find_ops(self):
+        obj = Ops()
+        self.assertEqual(['a', 'b'], util.find_ops(obj))
+        obj.c = lambda: 1
+        self.assertEqual(['a', 'b', 'c'], util.find_ops(obj))
+        self.assertEqual(['a', 'b'], util.find_ops(Ops()))
+        Ops.d = lambda self: 1
+        util.invalidate_ops(Ops)
+        self.assertEqual(['a', 'b', 'd'], util.find_ops(Ops()))
+        del Ops.d
+        util.invalidate_ops()
+
+
+class Ops(object):
+    x = 1
+
+    def a(self):
+        return
+
+    def b(self):
+        return
+
+    def _c(self):
+        return